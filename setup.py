@@ -37,6 +37,7 @@ setup(
     keywords="music player shuffle curses ncurses minimal simple",
     url=urls[0],
     packages=["simple_shuffle"],
-    install_requires=["pygame", "mutagen", "file-magic", "click", "blist"],
+    install_requires=["pygame", "mutagen", "file-magic", "click", "blist",
+                      "numpy"],
     setup_requires=["gitpython"]
 )
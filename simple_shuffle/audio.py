@@ -0,0 +1,366 @@
+"""The audio backends a Player can play through.
+
+PygameBackend plays through pygame's mixer, which is what's normally used.
+There's only one mixer in a process, so ProcessBackend runs a PygameBackend
+in a process of its own, for players which need to be heard at the same
+time as another (zones). NullBackend plays nothing; it keeps track of the
+position in a track by a clock, which can be simulated so that benchmarks
+and tests can run the whole player quickly and with the same results every
+time.
+"""
+import os
+import pickle
+import subprocess
+import sys
+from abc import ABC, abstractmethod
+from io import BytesIO
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable, Optional, Union
+from strict_hint import strict
+from simple_shuffle.config import Config
+
+
+class PlaybackError(Exception):
+    """A backend was unable to play a file."""
+
+
+class AudioBackend(ABC):
+    """What a Player needs from something that plays audio.
+
+    Positions are in milliseconds, and are -1 when nothing is playing, as
+    with pygame.mixer.music.get_pos. owner is the Player currently using
+    the backend, for backends which can only play for one at a time.
+    """
+    error = PlaybackError
+    owner = None
+
+    @abstractmethod
+    def prepare(self, sample_rate: int) -> None:
+        """Get ready to play audio at this sample rate."""
+
+    @abstractmethod
+    def load(self, source: Union[str, BytesIO], namehint: str='') -> None:
+        """Load a file, or an in-memory copy of one, to be played."""
+
+    @abstractmethod
+    def play(self) -> None:
+        """Start playing the loaded track from the beginning."""
+
+    @abstractmethod
+    def pause(self) -> None:
+        """Pause playback where it is."""
+
+    @abstractmethod
+    def unpause(self) -> None:
+        """Carry on from where playback was paused."""
+
+    @abstractmethod
+    def stop(self) -> None:
+        """Stop playing the loaded track."""
+
+    @abstractmethod
+    def rewind(self) -> None:
+        """Go back to the start of the loaded track."""
+
+    @abstractmethod
+    def set_volume(self, volume: float) -> None:
+        """Set the volume, from 0.0 to 1.0."""
+
+    @property
+    @abstractmethod
+    def position(self) -> int:
+        """How far into the track playback is, in milliseconds."""
+
+    @abstractmethod
+    def quit(self) -> None:
+        """Release the audio device."""
+
+
+class PygameBackend(AudioBackend):
+    """Play through pygame.mixer.music.
+
+    There's only one pygame mixer in a process, so only one of these
+    should be made; get_backend shares it. devicename picks an output other
+    than the default one.
+    """
+    def __init__(self, devicename: str=""):
+        from pygame import mixer
+        from pygame import error as PyGameError
+        self.mixer = mixer
+        self.error = PyGameError
+        self.devicename = devicename
+
+    def prepare(self, sample_rate: int) -> None:
+        """(Re)initialize the mixer, unless it's already at this rate."""
+        current = self.mixer.get_init()
+        if current is not None and current[0] == sample_rate:
+            self.mixer.music.stop()
+            return
+        self.mixer.quit()
+        if self.devicename:
+            self.mixer.init(sample_rate, devicename=self.devicename)
+        else:
+            self.mixer.init(sample_rate)
+
+    def load(self, source: Union[str, BytesIO], namehint: str='') -> None:
+        if isinstance(source, str):
+            self.mixer.music.load(source)
+        else:
+            self.mixer.music.load(source, namehint)
+
+    def play(self) -> None:
+        self.mixer.music.play()
+
+    def pause(self) -> None:
+        self.mixer.music.pause()
+
+    def unpause(self) -> None:
+        self.mixer.music.unpause()
+
+    def stop(self) -> None:
+        self.mixer.music.stop()
+
+    def rewind(self) -> None:
+        self.mixer.music.set_pos(0)
+
+    def set_volume(self, volume: float) -> None:
+        self.mixer.music.set_volume(volume)
+
+    @property
+    def position(self) -> int:
+        return self.mixer.music.get_pos()
+
+    def quit(self) -> None:
+        self.mixer.quit()
+
+
+class ProcessBackend(AudioBackend):
+    """Play through a PygameBackend in a child process.
+
+    Each call is pickled down a pipe to `python -m simple_shuffle.audio`,
+    which has a mixer of its own, and the result is sent back.
+    """
+    @strict
+    def __init__(self, devicename: str=""):
+        to_child, requests = os.pipe()
+        responses, from_child = os.pipe()
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "simple_shuffle.audio",
+                str(to_child), str(from_child), devicename
+            ],
+            pass_fds=(to_child, from_child),
+            env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+        )
+        os.close(to_child)
+        os.close(from_child)
+        self.requests = os.fdopen(requests, 'wb')
+        self.responses = os.fdopen(responses, 'rb')
+        self.lock = Lock()
+
+    def call(self, method: str, *arguments):
+        with self.lock:
+            try:
+                pickle.dump((method, arguments), self.requests)
+                self.requests.flush()
+                succeeded, result = pickle.load(self.responses)
+            except (EOFError, OSError):
+                raise PlaybackError("The audio process has stopped.")
+        if not succeeded:
+            raise PlaybackError(result)
+        return result
+
+    def prepare(self, sample_rate: int) -> None:
+        self.call("prepare", sample_rate)
+
+    def load(self, source: Union[str, BytesIO], namehint: str='') -> None:
+        if isinstance(source, BytesIO):
+            source = source.getvalue()
+        self.call("load", source, namehint)
+
+    def play(self) -> None:
+        self.call("play")
+
+    def pause(self) -> None:
+        self.call("pause")
+
+    def unpause(self) -> None:
+        self.call("unpause")
+
+    def stop(self) -> None:
+        self.call("stop")
+
+    def rewind(self) -> None:
+        self.call("rewind")
+
+    def set_volume(self, volume: float) -> None:
+        self.call("set_volume", volume)
+
+    @property
+    def position(self) -> int:
+        return self.call("position")
+
+    def quit(self) -> None:
+        try:
+            self.call("quit")
+        except PlaybackError:
+            pass
+        self.requests.close()
+        self.responses.close()
+        self.process.wait()
+
+
+def serve(requests, responses, devicename: str) -> None:
+    """Run a PygameBackend for a ProcessBackend until it quits."""
+    backend = PygameBackend(devicename)
+    while True:
+        try:
+            method, arguments = pickle.load(requests)
+        except EOFError:
+            # The parent has gone away.
+            break
+        if method == "load" and isinstance(arguments[0], bytes):
+            arguments = (BytesIO(arguments[0]),) + arguments[1:]
+        try:
+            result = getattr(backend, method)
+            if callable(result):
+                result = result(*arguments)
+            reply = True, result
+        except backend.error as err:
+            reply = False, str(err)
+        pickle.dump(reply, responses)
+        responses.flush()
+        if method == "quit":
+            break
+
+
+class SimulatedClock:
+    """A clock which only moves when it's told to."""
+    def __init__(self, start: float=0.0):
+        self.time = start
+
+    def __call__(self) -> float:
+        return self.time
+
+    def advance(self, seconds: float) -> None:
+        self.time += seconds
+
+
+class NullBackend(AudioBackend):
+    """Pretend to play audio, keeping time by a clock.
+
+    Loading takes load_time seconds, which are slept for on a real clock or
+    skipped over on a SimulatedClock. Each track lasts for duration(source)
+    seconds, after which the position is -1, as if it had ended.
+    """
+    def __init__(self,
+                 clock: Optional[Callable[[], float]]=None,
+                 load_time: float=0.0,
+                 duration: Optional[Callable]=None
+            ):
+        self.clock = clock or monotonic
+        self.load_time = load_time
+        self.duration = duration or (lambda source: 180.0)
+        self.volume = 1.0
+        self.sample_rate: Optional[int] = None
+        self.loaded = None
+        self.length = 0.0
+        self.started: Optional[float] = None
+        self.paused_at: Optional[float] = None
+
+    def wait(self, seconds: float):
+        if isinstance(self.clock, SimulatedClock):
+            self.clock.advance(seconds)
+        else:
+            sleep(seconds)
+
+    def prepare(self, sample_rate: int) -> None:
+        self.stop()
+        self.sample_rate = sample_rate
+
+    def load(self, source: Union[str, BytesIO], namehint: str='') -> None:
+        if isinstance(source, str):
+            try:
+                open(source, 'rb').close()
+            except OSError as err:
+                raise PlaybackError(err)
+        self.stop()
+        self.wait(self.load_time)
+        self.loaded = source
+        self.length = self.duration(source)
+
+    def play(self) -> None:
+        if self.loaded is None:
+            raise PlaybackError("Nothing is loaded.")
+        self.started = self.clock()
+        self.paused_at = None
+
+    def pause(self) -> None:
+        if self.started is not None and self.paused_at is None:
+            self.paused_at = self.clock()
+
+    def unpause(self) -> None:
+        if self.paused_at is not None:
+            self.started += self.clock() - self.paused_at
+            self.paused_at = None
+
+    def stop(self) -> None:
+        self.started = None
+        self.paused_at = None
+
+    def rewind(self) -> None:
+        if self.started is not None:
+            self.started = self.clock() if self.paused_at is None\
+                else self.paused_at
+
+    def set_volume(self, volume: float) -> None:
+        self.volume = min(max(volume, 0.0), 1.0)
+
+    @property
+    def position(self) -> int:
+        if self.started is None:
+            return -1
+        now = self.clock() if self.paused_at is None else self.paused_at
+        elapsed = now - self.started
+        if elapsed >= self.length:
+            return -1
+        return int(elapsed * 1000)
+
+    def quit(self) -> None:
+        self.stop()
+        self.loaded = None
+
+
+_pygame_backend: Optional[PygameBackend] = None
+
+
+@strict
+def get_backend(name: str=Config.audio_backend,
+                separate: bool=False,
+                device: str=""
+            ) -> AudioBackend:
+    """Get a backend by name: "pygame" or "null".
+
+    Every null backend is a new one. Pygame backends are shared, unless
+    separate is given, in which case it's a ProcessBackend which can be
+    heard at the same time as the others. device is the output to play to.
+    """
+    global _pygame_backend
+    if name == "null":
+        return NullBackend()
+    if name != "pygame":
+        raise ValueError("Unknown audio backend: %s" % name)
+    if separate:
+        return ProcessBackend(device)
+    if _pygame_backend is None:
+        _pygame_backend = PygameBackend(device)
+    return _pygame_backend
+
+
+if __name__ == '__main__':
+    serve(
+        os.fdopen(int(sys.argv[1]), 'rb'),
+        os.fdopen(int(sys.argv[2]), 'wb'),
+        sys.argv[3]
+    )
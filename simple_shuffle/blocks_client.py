@@ -1,13 +1,13 @@
 #!/usr/bin/env python3.6
 """A client for simple_shuffle to be used with i3blocks status bar."""
 import os
-from requests import get, Response
+from requests import Response
 from requests.exceptions import ConnectionError
 from strict_hint import strict
 from typing import Union
+from simple_shuffle.client import shared_client
 from simple_shuffle.config import Config
 
-base_url = "http://localhost:5000"
 color = "#FFFFFF"
 
 
@@ -15,7 +15,7 @@ color = "#FFFFFF"
 def query(endpoint: str) -> Response:
     """Attempt to get the specified API endpoint, or show no server message."""
     try:
-        return get("%s/%s" % (base_url, endpoint))
+        return shared_client().get(endpoint)
     except ConnectionError:
         print("shuffle server not running")
         print("")
@@ -69,24 +69,16 @@ if instance == "playpause":
 
 if instance == "songinfo":
     # Show text from the song_info method
-    info = query("song_info").content.decode()
-    print(info)
-    if ", track" in info:
-        print(info.split(", track")[0])
-    else:
-        print(info)
+    print(query("song_info").content.decode())
+    print(query("song_info_short").content.decode())
     print(color)
     exit(0)
 
 if instance == "songinfo.short":
-    # Show text from the song_info method
-    info = query("song_info").content.decode()
-    if ", track" in info:
-        print(info.split(", track")[0])
-        print(info.split(", track")[0])
-    else:
-        print(info)
-        print(info)
+    # Show text from the song_info_short method
+    info = query("song_info_short").content.decode()
+    print(info)
+    print(info)
     print(color)
     exit(0)
 
@@ -0,0 +1,104 @@
+"""A persistent cache of values computed from files in the library.
+
+Values are stored per file along with the file's modification time and
+size, so a value is only returned while the file it came from is unchanged.
+Each kind of value (a hash, a loudness measurement...) is kept separately.
+"""
+import os
+import sqlite3
+from json import dumps, loads
+from os.path import dirname
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+from strict_hint import strict
+from simple_shuffle.config import Config
+
+
+log = Config.logger
+
+
+def file_key(filepath: str) -> Optional[Tuple[int, int]]:
+    """Get the (mtime, size) pair a cached value is valid for."""
+    try:
+        info = os.stat(filepath)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+class FileCache:
+    """Values keyed by file path, invalidated when the file changes."""
+    @strict
+    def __init__(self, location: str=Config.cache_file):
+        if location != ":memory:":
+            os.makedirs(dirname(location), exist_ok=True)
+        self.lock = Lock()
+        self.db = sqlite3.connect(location, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " kind TEXT, path TEXT, mtime INTEGER, size INTEGER,"
+                " value TEXT, PRIMARY KEY (kind, path))"
+            )
+
+    @strict
+    def get(self, kind: str, filepath: str):
+        """Get a value if it was cached for the current version of a file."""
+        return self.get_many(kind, [filepath]).get(filepath)
+
+    @strict
+    def get_many(self, kind: str, filepaths: List[str]) -> Dict[str, Any]:
+        """Get all of the values which are still valid for these files."""
+        found = {}
+        with self.lock:
+            for filepath in filepaths:
+                key = file_key(filepath)
+                if key is None:
+                    continue
+                row = self.db.execute(
+                    "SELECT value FROM entries WHERE kind = ? AND path = ?"
+                    " AND mtime = ? AND size = ?",
+                    (kind, filepath) + key
+                ).fetchone()
+                if row is not None:
+                    found[filepath] = loads(row[0])
+        return found
+
+    @strict
+    def put_many(self, kind: str, values: Dict[str, Any]) -> None:
+        """Store values computed from the current version of these files."""
+        rows = []
+        for filepath, value in values.items():
+            key = file_key(filepath)
+            if key is not None:
+                rows.append((kind, filepath) + key + (dumps(value),))
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    @strict
+    def put(self, kind: str, filepath: str, value) -> None:
+        """Store one value computed from the current version of a file."""
+        self.put_many(kind, {filepath: value})
+
+    @strict
+    def forget_missing(self, kind: str, filepaths: List[str]) -> int:
+        """Remove entries for files which aren't in the library anymore."""
+        keep = set(filepaths)
+        with self.lock, self.db:
+            stale = [
+                (kind, path) for (path,) in self.db.execute(
+                    "SELECT path FROM entries WHERE kind = ?", (kind,)
+                ) if path not in keep
+            ]
+            self.db.executemany(
+                "DELETE FROM entries WHERE kind = ? AND path = ?", stale
+            )
+        if stale:
+            log.debug("Forgot %d stale %s entries", len(stale), kind)
+        return len(stale)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,107 @@
+"""A connection to the simple_shuffle server, shared by the clients.
+
+Requests go through one keep-alive session, so polling the server doesn't
+open a new connection every time. That only helps a client which keeps
+running, like the curses one; the i3blocks client is a new process for
+every poll, so all it gets from this is the retries. Connecting is retried
+with backoff, and responses from read-only endpoints are reused for a short
+while, as set in Config.client_cache_ttl. Requests to any other endpoint (a
+skip, a volume change...) might change what those would say, so they clear
+the reused responses.
+"""
+from time import monotonic, sleep
+from typing import Dict, Optional, Tuple
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from urllib3.util.retry import Retry
+from strict_hint import strict
+from simple_shuffle.config import Config
+
+
+class Client:
+    """A pooled, caching connection to the server API."""
+    @strict
+    def __init__(self, base_url: str=Config.server_url):
+        self.base_url = base_url
+        self.session = Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=Config.client_pool_size,
+            # Only retry failures to connect, when the request can't have
+            # reached the server; retrying a skip which timed out could skip
+            # twice.
+            max_retries=Retry(
+                total=Config.client_retries,
+                connect=Config.client_retries,
+                read=0,
+                status=0,
+                backoff_factor=Config.client_backoff
+            )
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.responses: Dict[tuple, Tuple[float, Response]] = {}
+
+    def get(self, endpoint: str, params: Optional[dict]=None) -> Response:
+        """Get an API endpoint, reusing a recent response if allowed to."""
+        key = (endpoint, tuple(sorted(params.items())) if params else ())
+        # Zones' endpoints are cached the same as the default zone's.
+        ttl = Config.client_cache_ttl.get(endpoint.rsplit('/', 1)[-1])
+        if ttl is None:
+            self.responses.clear()
+        elif key in self.responses:
+            expires, response = self.responses[key]
+            if monotonic() < expires:
+                return response
+        response = self.session.get(
+            "%s/%s" % (self.base_url, endpoint), params=params
+        )
+        if ttl and response.ok:
+            self.responses[key] = monotonic() + ttl, response
+        return response
+
+    @strict
+    def post(self, endpoint: str, json=None) -> Response:
+        """Post to an API endpoint. This is never cached."""
+        self.responses.clear()
+        return self.session.post(
+            "%s/%s" % (self.base_url, endpoint), json=json
+        )
+
+    @strict
+    def wait_until_ready(self, timeout: float=Config.ready_timeout) -> bool:
+        """Wait for the server to start and finish loading the library.
+
+        Returns whether it became ready before the timeout.
+        """
+        deadline = monotonic() + timeout
+        while monotonic() < deadline:
+            try:
+                response = self.session.get("%s/ready" % self.base_url)
+                if response.status_code == 200:
+                    return True
+                if response.status_code != 503:
+                    Config.logger.error(
+                        "Server failed to load: %s", response.text
+                    )
+                    return False
+            except ConnectionError:
+                # Not listening yet.
+                pass
+            sleep(Config.ready_poll_interval)
+        return False
+
+    def close(self):
+        self.session.close()
+
+
+_client: Optional[Client] = None
+
+
+def shared_client() -> Client:
+    """Get the Client shared by everything in this process."""
+    global _client
+    if _client is None:
+        _client = Client()
+    return _client
@@ -55,5 +55,110 @@ class Config:
     display_refresh_delay = 10
     sample_rate = 44100
     socket_file_location = os.path.join(root, "tmp", "simple_shuffle.sock")
-    server_url = "http://127.0.0.1:5000"
+    server_host = "127.0.0.1"
+    server_port = int(os.environ.get("simple_shuffle_port", 5000))
+    server_url = "http://%s:%d" % (server_host, server_port)
     frozen_threshold = 5
+    # "shuffle" shuffles a list of the whole library up front, "permutation"
+    # computes the order on the fly from a seed, which is better for huge
+    # libraries. A permutation can be resumed from its seed and index.
+    shuffle_mode = os.environ.get("simple_shuffle_mode", "shuffle")
+    shuffle_seed = int(os.environ["simple_shuffle_seed"]) \
+        if "simple_shuffle_seed" in os.environ else None
+    shuffle_index = int(os.environ.get("simple_shuffle_index", 0))
+    # Memory budget, in bytes, for reading upcoming tracks ahead of time, and
+    # how many tracks ahead to read. A budget of 0 disables the buffer.
+    prefetch_budget = int(
+        os.environ.get("simple_shuffle_prefetch_budget", 64 * 1024 * 1024)
+    )
+    prefetch_lookahead = 2
+    # Bytes of the upcoming tracks to ask the OS to read into its page cache
+    # ahead of time, and how many tracks ahead, so that the next track
+    # doesn't wait on a disk spinning up or a network share. Tracks nearest
+    # the front get their share of the budget first. 0 disables it.
+    readahead_budget = int(
+        os.environ.get("simple_shuffle_readahead_budget", 256 * 1024 * 1024)
+    )
+    readahead_lookahead = int(
+        os.environ.get("simple_shuffle_readahead_lookahead", 8)
+    )
+    # Where values computed from the library's files (hashes, loudness...)
+    # are kept between runs.
+    cache_file = os.environ.get(
+        "simple_shuffle_cache",
+        os.path.join(
+            os.path.expanduser("~"), ".cache", "simple_shuffle", "cache.sqlite"
+        )
+    )
+    # Play only one copy of each set of identical files. Duplicates are
+    # found by size, then by hashing the start and end of the file, and
+    # optionally by hashing the whole file.
+    deduplicate = os.environ.get("simple_shuffle_dedup", "1") != "0"
+    deduplicate_full_hash = False
+    # Where plays and skips are recorded ("" to not record them), how often
+    # recorded events are written, in seconds, and after how many events
+    # they're folded into per-track totals, keeping only the most recent
+    # history_keep events themselves.
+    history_file = os.environ.get(
+        "simple_shuffle_history",
+        os.path.join(os.path.dirname(cache_file), "history.sqlite")
+    )
+    history_flush_interval = 5.0
+    history_compact_every = 1000
+    history_keep = 10_000
+    # Adjust the volume of each track towards a target loudness, in dBFS,
+    # by no more than loudness_max_gain dB either way. Tracks are measured
+    # ahead of time with `python -m simple_shuffle.loudness FOLDER`, so this
+    # is off unless simple_shuffle_normalize is set to 1. To leave room for
+    # turning tracks up, measured tracks are played loudness_max_gain dB
+    # quieter than the requested volume; unmeasured ones are played at it.
+    normalize_loudness = os.environ.get("simple_shuffle_normalize", "0") != "0"
+    loudness_target = -20.0
+    loudness_max_gain = 12.0
+    # Seconds to wait after a skip for another one before loading the track.
+    skip_debounce = 0.15
+    # Names of zones to run alongside the default one, each an independent
+    # player of the same library at /zones/<name>/..., playing through its
+    # own audio process. The output device of each zone (SDL's name for it)
+    # can be given as "zone=device;zone=device"; by default they all play
+    # to the default device.
+    zones = [
+        name for name in os.environ.get("simple_shuffle_zones", "").split(",")
+        if name
+    ]
+    zone_devices = dict(
+        pair.split("=", 1) for pair in
+        os.environ.get("simple_shuffle_zone_devices", "").split(";")
+        if "=" in pair
+    )
+    # How the clients talk to the server: the number of connections kept
+    # open, how many times to retry connecting (with exponential backoff
+    # starting at client_backoff seconds), and how many seconds responses
+    # from each read-only endpoint may be reused for (0 to never reuse).
+    # A request to any endpoint not listed clears the reused responses.
+    client_pool_size = 4
+    client_retries = 2
+    client_backoff = 0.05
+    client_cache_ttl = {
+        "isplaying": 0.5,
+        "current_volume": 0.5,
+        "current_file": 1.0,
+        "song_info": 1.0,
+        "song_info_short": 1.0,
+        "shuffle_state": 1.0,
+        "queue": 1.0,
+        "current_position": 0,
+        "current_time": 0,
+        "displayed_text": 0,
+        "search": 0,
+        "zones": 0,
+        "buffer_stats": 0,
+        "stats": 0,
+    }
+    # How long clients wait for the server to load the library, and how
+    # often they check, in seconds.
+    ready_timeout = 120.0
+    ready_poll_interval = 0.05
+    # What to play audio through: "pygame", or "null" to play nothing while
+    # keeping time as if playing, for benchmarks and tests.
+    audio_backend = os.environ.get("simple_shuffle_audio", "pygame")
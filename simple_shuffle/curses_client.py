@@ -4,11 +4,15 @@ import curses
 from binascii import hexlify
 from strict_hint import strict
 from typing import Callable, Dict, Union
-from requests import get, Response
+from requests import Response
 from requests.exceptions import ConnectionError
 from datetime import datetime
-from blist import blist
-from simple_shuffle.server import FrozenDetector
+try:
+    from blist import blist
+except ImportError:
+    blist = list
+from simple_shuffle.frozen import FrozenDetector
+from simple_shuffle.client import shared_client
 from simple_shuffle.config import Config
 
 
@@ -33,6 +37,8 @@ class CursesInterface():
     """A curses interface to the Flask server API."""
     def __init__(self):
         self.freezedetect = FrozenDetector()
+        if not shared_client().wait_until_ready():
+            exit("The shuffle server didn't start.")
         self.show()
 
     @property
@@ -46,19 +52,25 @@ class CursesInterface():
         """Query the server for a specified method."""
         if server_method == "disconnect":
             exit(0)
+        stopping = server_method in ("stop", "quit", "stop_drop_and_roll")
         try:
-            return get("%s/%s" % (Config.server_url, server_method))
+            response = shared_client().get(server_method)
         except ConnectionError:
-            if server_method in ("stop", "quit", "stop_drop_and_roll"):
+            if stopping:
                 exit(0)
             raise
+        if stopping:
+            # A server running in this process can't exit the process from
+            # its request thread, so exit here.
+            exit(0)
+        return response
 
     @staticmethod
     @strict
     def displayed_text(columns: int, lines: int) -> Dict[str, Dict[str, str]]:
         """Query the server for the value from Player.displayed_text."""
-        return get(
-            f"{Config.server_url}/displayed_text?x={columns}&y={lines}"
+        return shared_client().get(
+            "displayed_text", {"x": columns, "y": lines}
         ).json()
 
     def show(self):
@@ -152,4 +164,5 @@ class CursesInterface():
                 logfile.write(text + '\n')
 
 
-CursesInterface()
+if __name__ == '__main__':
+    CursesInterface()
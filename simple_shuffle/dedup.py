@@ -0,0 +1,128 @@
+"""Find identical files in the library, so that each is played only once.
+
+Finding duplicates happens in stages, each of which only looks at the files
+the previous stage couldn't tell apart:
+
+    1. files are grouped by size, which only needs a stat;
+    2. files of the same size are grouped by a hash of their first and last
+       blocks;
+    3. optionally, what's left is grouped by a hash of the whole file.
+
+Hashing is spread over a process pool and the results are kept in a
+FileCache, so a rescan only hashes files which are new or have changed.
+"""
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from typing import Callable, Dict, List, Optional
+from strict_hint import strict
+from simple_shuffle.cache import FileCache
+from simple_shuffle.config import Config
+
+
+log = Config.logger
+EDGE_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def edge_hash(filepath: str) -> Optional[str]:
+    """Hash the first and last EDGE_SIZE bytes of a file."""
+    digest = blake2b(digest_size=16)
+    try:
+        with open(filepath, 'rb') as file:
+            digest.update(file.read(EDGE_SIZE))
+            size = os.fstat(file.fileno()).st_size
+            if size > EDGE_SIZE:
+                file.seek(max(EDGE_SIZE, size - EDGE_SIZE))
+                digest.update(file.read(EDGE_SIZE))
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def full_hash(filepath: str) -> Optional[str]:
+    """Hash the entire contents of a file."""
+    digest = blake2b(digest_size=32)
+    try:
+        with open(filepath, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class DuplicateFinder:
+    """Group the files of a library which have identical contents."""
+    def __init__(self,
+                 cache: Optional[FileCache]=None,
+                 full: bool=False,
+                 workers: Optional[int]=None
+            ):
+        self.cache = cache
+        self.full = full
+        self.workers = workers
+
+    @strict
+    def groups(self, files: List[str]) -> List[List[str]]:
+        """Get every group of two or more identical files."""
+        by_size = defaultdict(list)
+        for filepath in files:
+            try:
+                by_size[os.stat(filepath).st_size].append(filepath)
+            except OSError:
+                continue
+        groups = [group for group in by_size.values() if len(group) > 1]
+        log.debug("%d groups of files with the same size", len(groups))
+        if not groups:
+            return []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            groups = self.split(groups, "edge_hash", edge_hash, pool)
+            if self.full:
+                groups = self.split(groups, "full_hash", full_hash, pool)
+        log.info("Found %d groups of duplicate files", len(groups))
+        return groups
+
+    def split(self,
+              groups: List[List[str]],
+              kind: str,
+              hasher: Callable[[str], Optional[str]],
+              pool: ProcessPoolExecutor
+            ) -> List[List[str]]:
+        """Split groups by a hash, dropping any files which are unique."""
+        files = [filepath for group in groups for filepath in group]
+        hashes: Dict[str, Optional[str]] = \
+            self.cache.get_many(kind, files) if self.cache else {}
+        missing = [filepath for filepath in files if filepath not in hashes]
+        computed = dict(zip(
+            missing, pool.map(hasher, missing, chunksize=64)
+        ))
+        if self.cache:
+            self.cache.put_many(kind, {
+                filepath: value for filepath, value in computed.items()
+                if value is not None
+            })
+        hashes.update(computed)
+        split = []
+        for group in groups:
+            by_hash = defaultdict(list)
+            for filepath in group:
+                if hashes[filepath] is not None:
+                    by_hash[hashes[filepath]].append(filepath)
+            split.extend(
+                same for same in by_hash.values() if len(same) > 1
+            )
+        return split
+
+    @strict
+    def unique(self, files: List[str]) -> List[str]:
+        """Get files with all but one copy of each duplicate removed.
+
+        The copy which is kept is the first one in sorted order, so that the
+        same one is chosen every time the library is scanned.
+        """
+        dropped = set()
+        for group in self.groups(files):
+            dropped.update(sorted(group)[1:])
+        return [filepath for filepath in files if filepath not in dropped]
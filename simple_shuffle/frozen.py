@@ -0,0 +1,44 @@
+"""Detect that playback has stalled."""
+from typing import Union
+from simple_shuffle.config import Config
+
+
+class FrozenDetector:
+    """Detect that playback has stalled."""
+    def __init__(self):
+        Config.logger.debug("Initializing the FrozenDetector")
+        self.same_counter: int = 0
+        self.time_value: int = 0
+
+    def check(self, time: Union[int, str, float]) -> bool:
+        """Get whether or not the time has been the same for too long.
+
+        "Too long" is defined in config.py as Config.frozen_threshold. The
+        method returns a boolean based on whether or not it's "frozen".
+
+        time is converted internally to an int, so using a value like "Seven"
+        will throw a ValueError and a value like 1.04309 will cause
+        unpredicatble results.
+        """
+        Config.logger.debug(
+            "Checking if frozen. Time: %d; Stored time: %d; Counter %d",
+            int(time),
+            self.time_value,
+            self.same_counter
+        )
+        if self.time_value == int(time):
+            self.same_counter += 1
+        self.time_value = int(time)
+        if self.same_counter >= Config.frozen_threshold:
+            Config.logger.warn(
+                "Frozen! Time: %d; Stored time: %d; Counter %d",
+                int(time),
+                self.time_value,
+                self.same_counter
+            )
+            return True
+        return False
+
+    def reset(self):
+        self.same_counter = 0
+        self.time_value = 0
@@ -0,0 +1,274 @@
+"""A record of what was played and skipped, and statistics drawn from it.
+
+Events go into an append-only log in a sqlite database. Each path is stored
+once, in the tracks table, so an event is just a time and two integers.
+Recording an event only adds it to a list in memory; a background thread
+writes the list in one transaction every Config.history_flush_interval
+seconds, so requests never wait on the disk.
+
+Every Config.history_compact_every events, the log is compacted: the events
+since the last compaction are folded into per-track totals, and all but the
+most recent Config.history_keep events are deleted. Statistics are read from
+the (indexed) totals, plus the few events which haven't been folded in yet,
+so they stay quick however many years of history there are.
+"""
+import os
+import sqlite3
+from os.path import dirname
+from threading import Event, Lock, Thread
+from time import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from strict_hint import strict
+from simple_shuffle.config import Config
+
+
+log = Config.logger
+PLAYED, SKIPPED = 0, 1
+EVENT_NAMES = {PLAYED: "played", SKIPPED: "skipped"}
+ORDERS = ("plays", "skips", "last_played")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (id INTEGER PRIMARY KEY, path TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY, time REAL, track INTEGER, kind INTEGER
+);
+CREATE TABLE IF NOT EXISTS totals (
+    track INTEGER PRIMARY KEY, plays INTEGER, skips INTEGER, last_played REAL
+);
+CREATE INDEX IF NOT EXISTS totals_plays ON totals (plays);
+CREATE INDEX IF NOT EXISTS totals_skips ON totals (skips);
+CREATE INDEX IF NOT EXISTS totals_last_played ON totals (last_played);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+
+class TrackStats(NamedTuple):
+    filepath: str
+    plays: int
+    skips: int
+    last_played: Optional[float]
+
+    def add(self, plays: int, skips: int, last_played: Optional[float]):
+        """These stats with some more events added."""
+        return TrackStats(
+            self.filepath,
+            self.plays + plays,
+            self.skips + skips,
+            max(filter(None, (self.last_played, last_played)), default=None)
+        )
+
+
+class History:
+    """The play and skip log, written in batches on a background thread."""
+    @strict
+    def __init__(self, location: str=Config.history_file):
+        if location != ":memory:":
+            os.makedirs(dirname(location), exist_ok=True)
+        self.lock = Lock()
+        self.db = sqlite3.connect(location, check_same_thread=False)
+        with self.db:
+            self.db.executescript(SCHEMA)
+        self.ids: Dict[str, int] = {}
+        # Events recorded but not yet written, as (time, path, kind).
+        self.pending: List[Tuple[float, str, int]] = []
+        self.pending_lock = Lock()
+        self.unfolded = self.db.execute(
+            "SELECT COUNT(*) FROM events WHERE id > ?", (self.folded_to,)
+        ).fetchone()[0]
+        self.closed = Event()
+        self.writer = Thread(target=self.run, name="History", daemon=True)
+        self.writer.start()
+
+    @strict
+    def record(self, kind: int, filepath: str) -> None:
+        """Note that a file was played or skipped."""
+        with self.pending_lock:
+            self.pending.append((time(), filepath, kind))
+
+    def run(self):
+        while not self.closed.wait(Config.history_flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as err:
+                log.error("Unable to write the play history: %s", err)
+
+    def flush(self) -> int:
+        """Write the recorded events, and compact if it's time to."""
+        with self.lock:
+            with self.pending_lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return 0
+            with self.db:
+                ids = self.track_ids({path for _, path, _ in batch})
+                self.db.executemany(
+                    "INSERT INTO events (time, track, kind) VALUES (?, ?, ?)",
+                    [(when, ids[path], kind) for when, path, kind in batch]
+                )
+            self.unfolded += len(batch)
+        if self.unfolded >= Config.history_compact_every:
+            self.compact()
+        return len(batch)
+
+    def track_ids(self, paths: set) -> Dict[str, int]:
+        """Get the id of each path, adding any which are new."""
+        new = [path for path in paths if path not in self.ids]
+        if new:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO tracks (path) VALUES (?)",
+                [(path,) for path in new]
+            )
+            for path in new:
+                self.ids[path] = self.db.execute(
+                    "SELECT id FROM tracks WHERE path = ?", (path,)
+                ).fetchone()[0]
+        return {path: self.ids[path] for path in paths}
+
+    @property
+    def folded_to(self) -> int:
+        """The id of the last event which has been added to the totals."""
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE key = 'folded_to'"
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def compact(self) -> None:
+        """Fold new events into the totals and trim the log."""
+        with self.lock, self.db:
+            start = self.folded_to
+            end = self.db.execute("SELECT MAX(id) FROM events").fetchone()[0]
+            if end is None or end <= start:
+                return
+            counts = self.db.execute(
+                "SELECT track, SUM(kind = ?), SUM(kind = ?),"
+                " MAX(CASE WHEN kind = ? THEN time END)"
+                " FROM events WHERE id > ? AND id <= ? GROUP BY track",
+                (PLAYED, SKIPPED, PLAYED, start, end)
+            ).fetchall()
+            self.db.executemany(
+                "INSERT OR IGNORE INTO totals VALUES (?, 0, 0, NULL)",
+                [(track,) for track, *_ in counts]
+            )
+            self.db.executemany(
+                "UPDATE totals SET plays = plays + ?, skips = skips + ?,"
+                " last_played = COALESCE(MAX(last_played, ?), last_played, ?)"
+                " WHERE track = ?",
+                [
+                    (plays, skips, last, last, track)
+                    for track, plays, skips, last in counts
+                ]
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('folded_to', ?)", (end,)
+            )
+            self.db.execute(
+                "DELETE FROM events WHERE id <= ?",
+                (end - Config.history_keep,)
+            )
+            self.unfolded = 0
+        log.debug("Folded %d tracks' events into the totals", len(counts))
+
+    def _unfolded(
+                self, filepath: Optional[str]=None
+            ) -> Dict[str, Tuple[int, int, Optional[float]]]:
+        """Count the events, of one file or all, not in the totals yet."""
+        query = (
+            "SELECT path, SUM(kind = ?), SUM(kind = ?),"
+            " MAX(CASE WHEN kind = ? THEN time END)"
+            " FROM events JOIN tracks ON tracks.id = events.track"
+            " WHERE events.id > ?"
+        )
+        arguments = [PLAYED, SKIPPED, PLAYED, self.folded_to]
+        if filepath is not None:
+            query += " AND path = ?"
+            arguments.append(filepath)
+        counts = {
+            path: (plays, skips, last) for path, plays, skips, last in
+            self.db.execute(query + " GROUP BY track", arguments)
+        }
+        with self.pending_lock:
+            pending = list(self.pending)
+        for when, path, kind in pending:
+            if filepath is not None and path != filepath:
+                continue
+            plays, skips, last = counts.get(path, (0, 0, None))
+            if kind == PLAYED:
+                counts[path] = plays + 1, skips, when
+            else:
+                counts[path] = plays, skips + 1, last
+        return counts
+
+    def _totals(self, filepath: str) -> TrackStats:
+        row = self.db.execute(
+            "SELECT plays, skips, last_played FROM totals"
+            " JOIN tracks ON tracks.id = totals.track WHERE path = ?",
+            (filepath,)
+        ).fetchone()
+        return TrackStats(filepath, *(row or (0, 0, None)))
+
+    @strict
+    def track(self, filepath: str) -> TrackStats:
+        """How often a file has been played and skipped."""
+        with self.lock:
+            stats = self._totals(filepath)
+            for counts in self._unfolded(filepath).values():
+                stats = stats.add(*counts)
+            return stats
+
+    @strict
+    def top(self, count: int=10, by: str="plays") -> List[TrackStats]:
+        """The count most played, most skipped or last played files.
+
+        Raises ValueError if by isn't one of ORDERS, or count is less than 1.
+        """
+        if by not in ORDERS:
+            raise ValueError("Can't order by %s" % by)
+        if count < 1:
+            raise ValueError("Can't list %d tracks" % count)
+        with self.lock:
+            stats = {
+                row[0]: TrackStats(*row) for row in self.db.execute(
+                    "SELECT path, plays, skips, last_played FROM totals"
+                    " JOIN tracks ON tracks.id = totals.track"
+                    " ORDER BY %s DESC LIMIT ?" % by,
+                    (count,)
+                )
+            }
+            # Unfolded events can only add to a file's totals, so only the
+            # files they're about could overtake the top of the totals.
+            for path, counts in self._unfolded().items():
+                stats[path] = stats.get(path, self._totals(path)).add(*counts)
+        return sorted(
+            stats.values(),
+            key=lambda track: getattr(track, by) or 0,
+            reverse=True
+        )[:count]
+
+    @strict
+    def recent(self, count: int=10) -> List[Tuple[float, str, str]]:
+        """The last count events, newest first, as (time, path, event).
+
+        Raises ValueError if count is less than 1.
+        """
+        if count < 1:
+            raise ValueError("Can't list %d events" % count)
+        with self.lock:
+            with self.pending_lock:
+                pending = self.pending[::-1][:count]
+            logged = self.db.execute(
+                "SELECT time, path, kind FROM events"
+                " JOIN tracks ON tracks.id = events.track"
+                " ORDER BY events.id DESC LIMIT ?",
+                (count - len(pending),)
+            ).fetchall()
+        return [
+            (when, path, EVENT_NAMES[kind]) for when, path, kind in
+            pending + logged
+        ]
+
+    def close(self):
+        """Stop the writer, and write whatever's left."""
+        self.closed.set()
+        self.writer.join()
+        self.flush()
+        with self.lock:
+            self.db.close()
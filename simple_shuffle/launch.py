@@ -1,33 +1,103 @@
 """CLI and launcher for simple_shuffle."""
 import click as cli
 import os
-from simple_shuffle.curses_client import CursesInterface
+from threading import Thread
+from typing import Optional
+from simple_shuffle.config import Config
 
 
 @cli.command("shuffle")
-@cli.option("server_only")
+@cli.option("--server-only", "server_only", is_flag=True)
+@cli.option("--spawn", "spawn", is_flag=True)
 @cli.argument("shuffle_folder", required=False)
 def main(*args, **kwargs):
     """Simply shuffle your library. That's all.
 
     You can enable just the server backend with the server_only option, and
     specify the folder to be shuffled. An ncurses display is enabled by
-    default.
+    default. The server runs in this process unless the spawn option is
+    given, in which case it's started with `flask run`.
     """
     os.environ["simple_shuffle_folder"] = kwargs['shuffle_folder']\
         or os.path.join(
             os.environ['HOME'], "Music"
         )
+    if kwargs['spawn']:
+        spawn_server()
+    elif kwargs['server_only']:
+        start_server().serve_forever()
+    else:
+        Thread(
+            target=start_server().serve_forever, name="server", daemon=True
+        ).start()
+    if not kwargs['server_only']:
+        # Imported once the server is listening, as requests is slow to
+        # import.
+        from simple_shuffle.curses_client import CursesInterface
+        CursesInterface()
+
+
+def start_server():
+    """Bind the server's socket in this process, ready to serve requests.
+
+    The socket is bound before the server module (and with it pygame, numpy
+    and the player) is imported, so requests are answered straight away:
+    with 503 until the import is done and the library is loaded, as /ready
+    says.
+    """
+    from werkzeug.serving import make_server
+    application = LazyApplication()
+    server = make_server(
+        Config.server_host, Config.server_port, application, threaded=True
+    )
+    application.start()
+    return server
+
+
+class LazyApplication:
+    """A WSGI app which imports the server's Flask app in the background."""
+    def __init__(self):
+        self.app = None
+        self.error: Optional[str] = None
+
+    def start(self):
+        Thread(target=self.load, name="importer", daemon=True).start()
+
+    def load(self):
+        try:
+            from simple_shuffle.server import app
+        except Exception as err:
+            self.error = "Unable to start the server: %s" % err
+            Config.logger.exception(self.error)
+            return
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        if self.app is not None:
+            return self.app(environ, start_response)
+        if self.error is not None:
+            status, body = "500 INTERNAL SERVER ERROR", self.error
+        else:
+            status, body = "503 SERVICE UNAVAILABLE", "The server is starting"
+        start_response(status, [
+            ("Content-Type", "text/plain"), ("Retry-After", "1")
+        ])
+        return [body.encode()]
+
+
+def spawn_server():
+    """Start the server as a separate `flask run` process."""
     server_filename = os.path.join(
         os.path.dirname(os.path.realpath(__file__)),
         "server.py"
     )
     exe = "flask"
     os.spawnlpe(os.P_NOWAIT, exe, exe, "run", {
-        "FLASK_APP":    server_filename,
-        "LANG":         os.environ['LANG'],
-        "LC_ALL":       os.environ["LC_ALL"],
-        "USER":         os.environ["USER"]
+        "FLASK_APP":                server_filename,
+        "FLASK_RUN_HOST":           Config.server_host,
+        "FLASK_RUN_PORT":           str(Config.server_port),
+        "simple_shuffle_folder":    os.environ["simple_shuffle_folder"],
+        "LANG":                     os.environ['LANG'],
+        "LC_ALL":                   os.environ["LC_ALL"],
+        "USER":                     os.environ["USER"]
     })
-    if not kwargs['server_only']:
-        CursesInterface()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3.6
+"""Simulate many clients polling a server, and report how it copes.
+
+Two kinds of client are simulated, each on its own thread:
+
+    i3blocks bars, which run a new process (so make a new connection) for
+    every block, polling isplaying, song_info and current_volume;
+
+    curses clients, which keep a connection open and poll current_position,
+    isplaying and displayed_text.
+
+Both poll every --interval seconds, and now and then skip or turn the volume
+up. At the end, the throughput and latency percentiles of each endpoint are
+printed. With --start FOLDER, a server is started for the test using SDL's
+dummy audio driver, so it runs without a sound card; with --audio null as
+well, it doesn't decode any audio at all.
+"""
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from random import Random
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+from typing import Dict, List, Optional
+import click as cli
+import requests
+from simple_shuffle.client import Client
+from simple_shuffle.config import Config
+
+
+BAR_ENDPOINTS = ("isplaying", "song_info", "current_volume")
+CURSES_ENDPOINTS = ("current_position", "isplaying", "displayed_text")
+
+
+class Results:
+    """Latencies of every request, by endpoint."""
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.lock = Lock()
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, duration: float) -> str:
+        lines = ["%-18s %8s %8s %7s %8s %8s %8s" % (
+            "endpoint", "requests", "req/s", "errors", "p50 ms", "p95 ms",
+            "p99 ms"
+        )]
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            lines.append("%-18s %8d %8.1f %7d %8.2f %8.2f %8.2f" % (
+                endpoint,
+                len(latencies),
+                len(latencies) / duration,
+                self.errors[endpoint],
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000,
+            ))
+        return "\n".join(lines)
+
+
+def percentile(ordered: List[float], percent: float) -> float:
+    """The nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class SimulatedClient(Thread):
+    """Poll some endpoints until told to stop, recording each request."""
+    def __init__(self,
+                 base_url: str,
+                 endpoints: tuple,
+                 keep_alive: bool,
+                 options: dict,
+                 results: Results,
+                 stop: Event,
+                 seed: int
+            ):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.endpoints = endpoints
+        self.session = requests.Session() if keep_alive else requests
+        self.options = options
+        self.results = results
+        self.stop = stop
+        self.random = Random(seed)
+
+    def request(self, endpoint: str, params: Optional[dict]=None):
+        start = monotonic()
+        try:
+            ok = self.session.get(
+                "%s/%s" % (self.base_url, endpoint), params=params
+            ).status_code < 500
+        except requests.exceptions.RequestException:
+            ok = False
+        self.results.record(endpoint, monotonic() - start, ok)
+
+    def run(self):
+        # Don't have every client poll at the same moment.
+        self.stop.wait(self.random.uniform(0, self.options["interval"]))
+        while not self.stop.is_set():
+            for endpoint in self.endpoints:
+                if endpoint == "displayed_text":
+                    self.request(endpoint, {"x": 80, "y": 24})
+                else:
+                    self.request(endpoint)
+            if self.random.random() < self.options["skip_rate"]:
+                self.request("skip")
+            if self.random.random() < self.options["volume_rate"]:
+                self.request("volume_up")
+            self.stop.wait(self.options["interval"])
+
+
+def start_server(folder: str, port: int, audio: str) -> subprocess.Popen:
+    """Run server.py on a headless audio driver in a subprocess."""
+    environment = dict(
+        os.environ,
+        SDL_AUDIODRIVER="dummy",
+        # Otherwise SDL catches SIGTERM, and the server can't be stopped.
+        SDL_NO_SIGNAL_HANDLERS="1",
+        simple_shuffle_folder=folder,
+        simple_shuffle_port=str(port),
+        simple_shuffle_audio=audio,
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "simple_shuffle.server"], env=environment
+    )
+
+
+@cli.command("loadtest")
+@cli.option("--url", default=Config.server_url, show_default=True)
+@cli.option("--start", "folder", default=None,
+            help="Start a headless server shuffling this folder.")
+@cli.option("--audio", type=cli.Choice(["pygame", "null"]),
+            default="pygame", show_default=True,
+            help="The audio backend of a server started with --start.")
+@cli.option("--bars", default=20, show_default=True)
+@cli.option("--curses", "curses_clients", default=5, show_default=True)
+@cli.option("--duration", default=30.0, show_default=True)
+@cli.option("--interval", default=1.0, show_default=True)
+@cli.option("--skip-rate", default=0.01, show_default=True)
+@cli.option("--volume-rate", default=0.01, show_default=True)
+def main(url, folder, audio, bars, curses_clients, duration, **options):
+    """Load test a simple_shuffle server with simulated clients."""
+    server = None
+    if folder is not None:
+        port = int(url.rsplit(":", 1)[1])
+        server = start_server(folder, port, audio)
+    try:
+        if not Client(url).wait_until_ready():
+            raise cli.ClickException("The server at %s isn't ready." % url)
+        results = Results()
+        stop = Event()
+        clients = [
+            SimulatedClient(
+                url, BAR_ENDPOINTS, False, options, results, stop, seed
+            ) for seed in range(bars)
+        ] + [
+            SimulatedClient(
+                url, CURSES_ENDPOINTS, True, options, results, stop, seed
+            ) for seed in range(bars, bars + curses_clients)
+        ]
+        for client in clients:
+            client.start()
+        sleep(duration)
+        stop.set()
+        for client in clients:
+            client.join()
+        print("%d bars and %d curses clients for %.0fs against %s" % (
+            bars, curses_clients, duration, url
+        ))
+        print(results.report(duration))
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(5)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+
+if __name__ == '__main__':
+    main()
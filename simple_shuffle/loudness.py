@@ -0,0 +1,114 @@
+#!/usr/bin/env python3.6
+"""Measure the loudness of the tracks in the library ahead of time.
+
+A track's loudness is the 95th percentile of its RMS level over 50ms
+blocks, in dBFS, which is how ReplayGain measures it (without the equal-
+loudness filter). Tracks are decoded and measured on a process pool, and
+each result is stored in the FileCache as soon as it's ready, so stopping
+an analysis loses nothing and rerunning it only measures new or changed
+files. With simple_shuffle_normalize=1, the player looks up the stored
+loudness when a track starts and adjusts the volume by the difference from
+Config.loudness_target.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+import click as cli
+import numpy
+from simple_shuffle.cache import FileCache
+from simple_shuffle.config import Config
+
+
+log = Config.logger
+KIND = "loudness"
+BLOCK_SECONDS = 0.05
+PERCENTILE = 95
+ANALYSIS_SAMPLE_RATE = 44100
+SAVE_EVERY = 32
+
+
+@cli.command("analyze")
+@cli.argument("shuffle_folder", required=False)
+def main(*args, **kwargs):
+    """Measure the loudness of every track in a folder which hasn't been yet.
+
+    By default it analyzes /home/$USER/Music.
+    """
+    from simple_shuffle.player import scan
+    folder = kwargs['shuffle_folder']\
+        or os.path.join(os.environ['HOME'], "Music")
+    measured = analyze(scan(folder), FileCache())
+    print("Measured %d tracks." % measured)
+
+
+def init_worker():
+    """Set up a headless mixer for decoding in a worker process."""
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    from pygame import mixer
+    mixer.init(ANALYSIS_SAMPLE_RATE, -16, 2)
+
+
+def measure(filepath: str) -> Optional[float]:
+    """Decode a file and measure its loudness in dBFS."""
+    from pygame import mixer, sndarray
+    from pygame import error as PyGameError
+    try:
+        samples = sndarray.array(mixer.Sound(filepath))
+    except (PyGameError, OSError) as err:
+        log.info("Unable to decode %s: %s", filepath, err)
+        return None
+    return loudness(samples, ANALYSIS_SAMPLE_RATE)
+
+
+def loudness(samples: numpy.ndarray, sample_rate: int) -> Optional[float]:
+    """Get the loudness, in dBFS, of an array of 16-bit samples."""
+    block = int(sample_rate * BLOCK_SECONDS)
+    usable = len(samples) // block * block
+    if usable == 0:
+        return None
+    samples = samples[:usable].astype(numpy.float32) / 32768
+    power = numpy.square(samples).reshape(usable // block, -1).mean(axis=1)
+    level = numpy.percentile(power, PERCENTILE)
+    return float(10 * numpy.log10(max(level, 1e-10)))
+
+
+def analyze(files: List[str],
+            cache: FileCache,
+            workers: Optional[int]=None
+        ) -> int:
+    """Measure every file which doesn't have a current measurement cached.
+
+    Returns the number of files which were measured.
+    """
+    cache.forget_missing(KIND, files)
+    done = cache.get_many(KIND, files)
+    todo = [filepath for filepath in files if filepath not in done]
+    log.info("%d of %d tracks need analysis", len(todo), len(files))
+    if not todo:
+        return 0
+    results: Dict[str, Optional[float]] = {}
+    with ProcessPoolExecutor(workers, initializer=init_worker) as pool:
+        jobs = {pool.submit(measure, filepath): filepath for filepath in todo}
+        for job in as_completed(jobs):
+            # Unmeasurable files are saved too, so they aren't retried.
+            results[jobs[job]] = job.result()
+            if len(results) >= SAVE_EVERY:
+                cache.put_many(KIND, results)
+                results.clear()
+    cache.put_many(KIND, results)
+    return len(todo)
+
+
+def gain(level: Optional[float]) -> float:
+    """The volume multiplier which brings a track to the target loudness."""
+    if level is None:
+        return 1.0
+    decibels = min(
+        max(Config.loudness_target - level, -Config.loudness_max_gain),
+        Config.loudness_max_gain
+    )
+    return 10 ** (decibels / 20)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Keyed bijective permutations of track indices.
+
+A Feistel network over the smallest even-width bit domain which covers the
+requested size, with cycle-walking to bring results back into range. Any
+index can be mapped in (expected) constant time and memory, so there's no
+need to materialize and shuffle a list of the whole library.
+"""
+from hashlib import blake2b
+from random import SystemRandom
+from strict_hint import strict
+
+
+class FeistelPermutation:
+    """A reproducible permutation of range(size), keyed by a seed."""
+    rounds = 4
+
+    @strict
+    def __init__(self, size: int, seed: int):
+        if size < 0:
+            raise ValueError("Can't permute a negative number of items.")
+        self.size = size
+        self.seed = seed
+        # Each half of the block gets an equal number of bits, so the domain
+        # is at most four times the size, and cycle-walking terminates after
+        # four steps on average.
+        self.half_bits = max(1, (max(size - 1, 1).bit_length() + 1) // 2)
+        self.half_mask = (1 << self.half_bits) - 1
+        self._key = seed.to_bytes(
+            (seed.bit_length() + 8) // 8, 'little', signed=True
+        )[:blake2b.MAX_KEY_SIZE]
+
+    def __len__(self):
+        return self.size
+
+    def _round(self, roundno: int, value: int) -> int:
+        """The round function; a keyed hash truncated to half a block."""
+        digest = blake2b(
+            value.to_bytes(8, 'little') + bytes((roundno,)),
+            digest_size=8,
+            key=self._key
+        ).digest()
+        return int.from_bytes(digest, 'little') & self.half_mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for roundno in range(self.rounds):
+            left, right = right, left ^ self._round(roundno, right)
+        return (left << self.half_bits) | right
+
+    def _decrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for roundno in reversed(range(self.rounds)):
+            left, right = right ^ self._round(roundno, left), left
+        return (left << self.half_bits) | right
+
+    @strict
+    def __getitem__(self, index: int) -> int:
+        """Get the position that index is moved to by this permutation."""
+        if not 0 <= index < self.size:
+            raise IndexError("Permutation index out of range: %d" % index)
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    @strict
+    def inverse(self, value: int) -> int:
+        """Get the index which this permutation moves to value."""
+        if not 0 <= value < self.size:
+            raise IndexError("Permutation value out of range: %d" % value)
+        index = self._decrypt(value)
+        while index >= self.size:
+            index = self._decrypt(index)
+        return index
+
+
+def new_seed() -> int:
+    """Generate a fresh random seed for a FeistelPermutation."""
+    return SystemRandom().getrandbits(64)
+
+
+@strict
+def derive_seed(seed: int, name: str) -> int:
+    """A seed of its own for each name, all reproducible from one seed."""
+    return int.from_bytes(blake2b(
+        name.encode(), digest_size=8, key=str(seed).encode()[:64]
+    ).digest(), 'little')
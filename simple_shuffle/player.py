@@ -1,8 +1,6 @@
 #!/usr/bin/env python3.6
 """Simple audio player for shuffling."""
 # SimpleAudio and PyAudio only accept .wav files, use PyGame
-from pygame import mixer
-from pygame import error as PyGameError
 from os import access, walk, environ
 from os import sep as root
 from os.path import isdir, basename
@@ -10,11 +8,27 @@ from os.path import join as getpath
 from os import R_OK as FILE_IS_READABLE
 from tinytag import TinyTag, TinyTagException
 from strict_hint import strict
-from typing import Dict, Union, Optional
+from typing import Dict, List, NamedTuple, Union, Optional, Tuple
 from textwrap import wrap
 from random import shuffle
+from io import BytesIO
+try:
+    from blist import blist
+except ImportError:
+    # blist doesn't build on recent Pythons. A list only makes the queue
+    # slower to change in the middle, which is rare for a play-next queue.
+    blist = list
+from threading import RLock, Timer, current_thread
 import click as cli
 from simple_shuffle.config import Config
+from simple_shuffle.permutation import FeistelPermutation, new_seed
+from simple_shuffle.history import History, PLAYED, SKIPPED
+from simple_shuffle.prefetch import TrackBuffer
+from simple_shuffle.readahead import ReadAhead
+from simple_shuffle import probe
+from simple_shuffle.audio import AudioBackend, get_backend
+from simple_shuffle.cache import FileCache
+from simple_shuffle.dedup import DuplicateFinder
 
 
 log = Config.logger
@@ -26,7 +40,7 @@ def main(*args, **kwargs):
     """The simple_shuffle script shuffles a folder of flac and ogg files.
 
     It does a true shuffle of all of the songs in the folder, without repeats,
-    unless you've got duplicates. Specify the folder to be shuffled on the
+    even if you've got duplicates. Specify the folder to be shuffled on the
     command line just after the name. By default it shuffles /home/$USER/Music.
     """
     if kwargs['shuffle_folder'] is None:
@@ -51,10 +65,24 @@ def list_recursively(f: str, *filepath) -> list:
     ]
 
 
+def scan(folder: str, cache: Optional[FileCache]=None) -> list:
+    """Get all of the files in a folder which should be played.
+
+    Unless Config.deduplicate is turned off, only one copy of each set of
+    identical files is included.
+    """
+    files = list_recursively(folder)
+    if Config.deduplicate:
+        files = DuplicateFinder(
+            cache or FileCache(), full=Config.deduplicate_full_hash
+        ).unique(files)
+    return files
+
+
 class Shuffler:
     """Get all of the files in the folder, in a shuffled order."""
-    def __init__(self, folder):
-        self.files = list_recursively(folder)
+    def __init__(self, folder, files=None):
+        self.files = scan(folder) if files is None else list(files)
         shuffle(self.files)
         self.index = 0
 
@@ -95,12 +123,206 @@ class Shuffler:
         """Get the current iteration point without updating the index."""
         return self.files[self.index - 1]
 
+    @strict
+    def upcoming(self, count: int) -> List[str]:
+        """Get up to count files which will be played next, in order."""
+        return self.files[self.index:self.index + count]
+
+
+class PermutedShuffler:
+    """Get all of the files in the folder, in a seeded pseudorandom order.
+
+    The list of files is sorted and never reordered; instead the position in
+    the play order is mapped to a position in the track table by a keyed
+    permutation, so moving around costs the same no matter how big the
+    library is. The whole state of the shuffle is the (seed, index) pair.
+    """
+    def __init__(self,
+                 folder: str,
+                 seed: Optional[int]=None,
+                 index: int=0,
+                 files: Optional[list]=None
+            ):
+        self.files = tuple(sorted(scan(folder) if files is None else files))
+        self.seed = new_seed() if seed is None else seed
+        self.order = FeistelPermutation(len(self.files), self.seed)
+        self.index = index
+
+    def __iter__(self):
+        return self
+
+    def at(self, index: int) -> Optional[str]:
+        """Get the file at a position in the play order, if there is one."""
+        if 0 <= index < len(self.files):
+            return self.files[self.order[index]]
+        return None
+
+    @property
+    def future(self) -> Optional[str]:
+        return self.at(self.index)
+
+    @property
+    def past(self) -> Optional[str]:
+        return self.at(self.index - 2)
+
+    def previous(self):
+        if self.index > 0:
+            self.index -= 1
+            return self.future
+        else:
+            raise StopIteration
+
+    def next(self) -> str:
+        """Get the current iteration point, and increment the index."""
+        if self.index < len(self.files):
+            self.index += 1
+            return self.current
+        else:
+            raise StopIteration
+
+    @property
+    def current(self) -> str:
+        """Get the current iteration point without updating the index.
+
+        Before the first call to next() this wraps around to the last file,
+        the same as indexing Shuffler.files with -1 does.
+        """
+        if not self.files:
+            raise IndexError("There are no files to play.")
+        return self.files[self.order[(self.index - 1) % len(self.files)]]
+
+    @property
+    def state(self) -> Tuple[int, int]:
+        """The (seed, index) pair needed to resume this shuffle."""
+        return self.seed, self.index
+
+    @strict
+    def upcoming(self, count: int) -> List[str]:
+        """Get up to count files which will be played next, in order."""
+        return [
+            self.files[self.order[index]] for index in range(
+                self.index, min(self.index + count, len(self.files))
+            )
+        ]
+
+
+class PlayQueue:
+    """Tracks to be played next, ahead of the shuffled order.
+
+    Wraps a Shuffler or PermutedShuffler, and passes through anything which
+    isn't to do with the queue. Playing a queued track doesn't move the
+    shuffler's index, so the shuffled order carries on where it left off.
+    The queue is a blist where that's installed, so adding, removing and
+    moving tracks anywhere in it takes O(log n) time.
+    """
+    def __init__(self, shuffler):
+        self.shuffler = shuffler
+        self.queued = blist()
+        self.playing: Optional[str] = None
+
+    def __getattr__(self, name):
+        return getattr(self.shuffler, name)
+
+    def __iter__(self):
+        return self
+
+    def enqueue(self, filepath: str, position: Optional[int]=None) -> None:
+        """Queue a file, at the end unless a position is given."""
+        if position is None:
+            self.queued.append(filepath)
+        else:
+            self.queued.insert(position, filepath)
+
+    @strict
+    def remove(self, position: int) -> str:
+        """Take the file at a position out of the queue."""
+        return self.queued.pop(position)
+
+    @strict
+    def move(self, source: int, destination: int) -> None:
+        """Move the file at one position in the queue to another."""
+        self.queued.insert(destination, self.queued.pop(source))
+
+    def clear(self):
+        """Remove everything from the queue."""
+        self.queued = blist()
+
+    @property
+    def future(self) -> Optional[str]:
+        if self.queued:
+            return self.queued[0]
+        return self.shuffler.future
+
+    def previous(self):
+        if self.playing is not None:
+            # Back to the shuffled track that was playing before the queue.
+            self.playing = None
+            return self.shuffler.current
+        return self.shuffler.previous()
+
+    def next(self) -> str:
+        """Get the next queued file, or the next file in the shuffle."""
+        if self.queued:
+            self.playing = self.queued.pop(0)
+            return self.playing
+        self.playing = None
+        return self.shuffler.next()
+
+    @property
+    def current(self) -> str:
+        """Get the current iteration point without updating the index."""
+        if self.playing is not None:
+            return self.playing
+        return self.shuffler.current
+
+    @strict
+    def upcoming(self, count: int) -> List[str]:
+        """Get up to count files which will be played next, in order."""
+        queued = list(self.queued[:count])
+        return queued + self.shuffler.upcoming(count - len(queued))
+
+
+class TrackDisplay(NamedTuple):
+    """The text shown for a track, worked out once from its tags."""
+    info: str
+    short: str
+    track_number: Optional[str]
+
+    @classmethod
+    def from_tags(cls, tags, filepath: str) -> 'TrackDisplay':
+        """Pick the most complete description the tags allow.
+
+        Makes several attempts at picking fewer tags before finally
+        displaying the filename as a fallback.
+        """
+        title = getattr(tags, 'title', None)
+        if title is None:
+            filename = get_filename(filepath)
+            return cls(filename, filename, None)
+        artist = getattr(tags, 'artist', None)
+        short = title if artist is None else "%s by %s" % (title, artist)
+        if getattr(tags, 'track', None) is None\
+                or getattr(tags, 'album', None) is None:
+            # Perhaps the tracknumber or album tags are missing, display
+            # just the song title and the artist.
+            return cls(short, short, None)
+        track_number = get_track_number(tags)
+        return cls(
+            "%s, track %s from the album %s." % (
+                short, track_number, tags.album
+            ),
+            short,
+            track_number
+        )
+
 
 class PlayingFile:
     """Methods and data for the currently playing file"""
     def __init__(self, filepath):
         self.filepath = filepath
         self._tags = False
+        self._display: Optional[TrackDisplay] = None
+        self._layouts: Dict[Tuple[int, int], Dict[str, Dict[str, int]]] = {}
 
     @property
     def tags(self):
@@ -114,6 +336,34 @@ class PlayingFile:
                     return get_filename(self.filepath)
         return self._tags
 
+    @property
+    def display(self) -> TrackDisplay:
+        """The display text for this file, built on first use."""
+        if self._display is None:
+            self._display = TrackDisplay.from_tags(self.tags, self.filepath)
+        return self._display
+
+    @strict
+    def layout(self, columns: int, lines: int) -> Dict[str, Dict[str, int]]:
+        """Where to put the song info text in a window of this size.
+
+        The text is wrapped to one-third of the width of the window and
+        centered. Layouts are kept for each window size they're asked for.
+        """
+        try:
+            return self._layouts[columns, lines]
+        except KeyError:
+            pass
+        song_txt_list = wrap(self.display.info, int(columns / 3))
+        layout = {
+            line: {
+                'x': int((columns - len(line)) / 2),
+                'y': int((lines - len(song_txt_list)) / 2 + lineno)
+            } for lineno, line in enumerate(song_txt_list)
+        }
+        self._layouts[columns, lines] = layout
+        return layout
+
     @strict
     def get_tiny_tags(self):
         """Alias for TinyTag.get()"""
@@ -136,8 +386,14 @@ class PlayingFile:
     def sample_rate(self) -> int:
         """Attempt to retrieve the sample rate.
 
-        In the case that the attempt fails, raise ValueError.
+        The stream header is probed first, falling back to TinyTag for
+        formats the probe doesn't know. In the case that both fail, raise
+        ValueError.
         """
+        try:
+            return probe.sample_rate(self.filepath)
+        except (ValueError, OSError):
+            log.debug("Probing %s failed, trying TinyTag", self.filepath)
         try:
             return self.get_tiny_tags().samplerate
         except (TinyTagException, LookupError):
@@ -146,16 +402,82 @@ class PlayingFile:
             )
 
 
-class Player:
-    """An object containing the actual player."""
+class Library:
+    """The files in a folder to be played, and what its players can share.
+
+    Several players (zones) shuffling the same folder only need it scanned
+    once, and can share the FileCache, the TrackBuffer, the ReadAhead and
+    the play History.
+    """
     @strict
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.cache = FileCache()
+        self.files = scan(folder, self.cache)
+        self.file_set = frozenset(self.files)
+        self.buffer = TrackBuffer(Config.prefetch_budget)\
+            if Config.prefetch_budget else None
+        self.readahead = ReadAhead(Config.readahead_budget)\
+            if Config.readahead_budget else None
+        self.history = History(Config.history_file)\
+            if Config.history_file else None
+
+    def __contains__(self, filepath):
+        return filepath in self.file_set
+
+
+class Player:
+    """An object containing the actual player.
+
+    Audio is played through an AudioBackend, by default the one named by
+    Config.audio_backend. When several players share a backend which can
+    only play one thing at once, like pygame's mixer, the one which most
+    recently began playback is the one which is heard. The others keep their
+    own place, queue and volume, and pause until they're played again.
+    """
     def __init__(self,
                  folder: str,
-                 autoplay: bool=True
+                 autoplay: bool=True,
+                 library: Optional[Library]=None,
+                 audio: Optional[AudioBackend]=None,
+                 seed: Optional[int]=Config.shuffle_seed,
+                 index: int=Config.shuffle_index
             ):
-        """Initialize the player with a folder to shuffle."""
+        """Initialize the player with a folder to shuffle.
+
+        seed and index are where to start a permutation shuffle from.
+        """
         self.shuffle_folder = folder
-        self.shuffle = Shuffler(self.shuffle_folder)
+        self.audio = audio or get_backend()
+        self.library = library or Library(self.shuffle_folder)
+        if Config.shuffle_mode == "permutation":
+            self.shuffle = PlayQueue(PermutedShuffler(
+                self.shuffle_folder,
+                seed,
+                index,
+                self.library.files
+            ))
+        else:
+            self.shuffle = PlayQueue(
+                Shuffler(self.shuffle_folder, self.library.files)
+            )
+        self.buffer = self.library.buffer
+        self.readahead = self.library.readahead
+        self.history = self.library.history
+        self.loudness_cache = self.library.cache\
+            if Config.normalize_loudness else None
+        # Tracks are played this much quieter than requested, so that a quiet
+        # track can be turned up by as much as a loud one is turned down.
+        self.headroom = 10 ** (Config.loudness_max_gain / 20)\
+            if Config.normalize_loudness else 1.0
+        self.paused = True
+        self.volume = 1.0
+        self.gain = 1.0
+        self.lock = RLock()
+        self.pending_playback: Optional[Timer] = None
+        # The track which playback was last started on.
+        self.started: Optional[str] = None
+        self.skipped_while_pending = False
         if autoplay:
             self.begin_playback()
 
@@ -163,7 +485,7 @@ class Player:
     @strict
     def current_volume(self) -> float:
         """Retrieve the current volume level."""
-        return mixer.music.get_volume()
+        return self.volume
 
     def volume_up(self):
         """Request that the audio volume be increased by 5%"""
@@ -171,9 +493,8 @@ class Player:
             "Volume requested to be turned up. Current volume "
             + str(self.current_volume)
         )
-        mixer.music.set_volume(
-            self.current_volume + 0.05
-        )
+        self.volume = min(self.volume + 0.05, 1.0)
+        self.apply_volume()
 
     def volume_down(self):
         """Request that the audio volume be decreased by 5%"""
@@ -181,28 +502,68 @@ class Player:
             "Volume requested to be turned down. Current volume "
             + str(self.current_volume)
         )
-        mixer.music.set_volume(
-            self.current_volume - 0.05
-        )
+        self.volume = max(self.volume - 0.05, 0.0)
+        self.apply_volume()
+
+    def apply_volume(self):
+        """Set the mixer to the requested volume, adjusted for loudness."""
+        if self.owns_audio:
+            self.audio.set_volume(
+                min(self.volume * self.gain / self.headroom, 1.0)
+            )
+
+    @property
+    def owns_audio(self) -> bool:
+        """Whether this is the player which is currently being heard."""
+        return self.audio.owner is self
+
+    def take_audio(self):
+        """Become the player which is heard, pausing whichever one was."""
+        previous_owner = self.audio.owner
+        if previous_owner is not None and previous_owner is not self:
+            previous_owner.paused = True
+        self.audio.owner = self
+
+    @strict
+    def track_gain(self, filepath: str) -> float:
+        """Look up the volume adjustment for a track's measured loudness.
+
+        Tracks which haven't been analyzed yet are turned up by the
+        headroom, so that they're played at the requested volume.
+        """
+        if self.loudness_cache is None:
+            return 1.0
+        # Imported here, as it brings in numpy, which is slow to import.
+        from simple_shuffle import loudness
+        level = self.loudness_cache.get(loudness.KIND, filepath)
+        if level is None:
+            return self.headroom
+        return loudness.gain(level)
 
     def pause_unpause(self):
         """Pause playing playback, or unpause if paused."""
+        if not self.owns_audio:
+            if self.paused:
+                # Take over the backend from whichever player has it.
+                self.begin_playback()
+            return
         if self.paused:
             log.debug("Resuming playback.")
-            mixer.music.unpause()
+            self.audio.unpause()
             self.paused = False
         else:
             log.debug(
                 "Pausing playback at %d",
                 self.current_position / 1000
             )
-            mixer.music.pause()
+            self.audio.pause()
             self.paused = True
 
     @strict
     def restart(self) -> str:
         """Restart the currently playing song."""
-        mixer.music.set_pos(0)
+        if self.owns_audio:
+            self.audio.rewind()
         return self.shuffle.current
 
     @strict
@@ -236,6 +597,18 @@ class Player:
             log.fatal("List of tracks has been exhausted.")
             exit(0)
 
+    def record_skip(self):
+        """Record that the track being played is about to be skipped.
+
+        Only a track which was started and hasn't ended counts; the tracks
+        passed over in a burst of skips were never loaded, let alone heard.
+        """
+        if self.history is None or self.started is None:
+            return
+        if self.started == self.shuffle.current\
+                and self.current_position != -1:
+            self.history.record(SKIPPED, self.started)
+
     @property
     @strict
     def current_file(self) -> PlayingFile:
@@ -266,50 +639,23 @@ class Player:
     @property
     @strict
     def song_info(self) -> str:
-        """Return appropriatly formatted metatags from the current file.
+        """Return appropriatly formatted metatags from the current file."""
+        info = self.current_file.display.info
+        log.debug("Song info: %s", info)
+        return info
 
-        Makes several attempts at picking fewer tags before finally displaying
-        the filename as a fallback.
-        """
-        outtxt: str = ''
-        if self.current_file.tags.title is None:
-            get_filename(self.current_file.filepath)
-        else:
-            if self.current_file.tags.track is None\
-                    or self.current_file.tags.album is None:
-                try:
-                    # Perhaps the tracknumber or album tags are missing, try
-                    # displaying just the song title and the artist
-                    outtxt = "%s by %s" % (
-                        self.current_file.tags.artist,
-                        self.current_file.tags.title
-                    )
-                    log.debug("Song info: %s", outtxt)
-                    return outtxt
-                except (KeyError, ValueError):
-                    try:
-                        # perhaps there's still a title tag, try just that.
-                        outtxt = self.current_file.tags.title
-                        log.debug("Song info: %s", outtxt)
-                        return outtxt
-                    except (KeyError, ValueError):
-                        # Just return the filename...
-                        get_filename(self.current_file.filepath)
-            else:
-                # the default output
-                outtxt = "%s by %s, track %s from the album %s." % (
-                    self.current_file.tags.title,
-                    self.current_file.tags.artist,
-                    get_track_number(self.current_file.tags),
-                    self.current_file.tags.album
-                )
-                log.debug("Song info: %s", outtxt)
-                return outtxt
+    @property
+    @strict
+    def song_info_short(self) -> str:
+        """Return just the title and artist, or whatever is available."""
+        return self.current_file.display.short
 
     @property
     def current_position(self):
         """Get the current position."""
-        return mixer.music.get_pos()
+        if not self.owns_audio:
+            return 0
+        return self.audio.position
 
     @property
     @strict
@@ -320,47 +666,97 @@ class Player:
         return "%d:%0d" % (minutes, seconds)
 
     @strict
-    def begin_playback(self) -> None:
-        """Play an audio file."""
-        mixer.quit()
+    def begin_playback(self, skipped: bool=False) -> None:
+        """Play an audio file.
+
+        If the file was read ahead of time by the TrackBuffer, it's played
+        from memory rather than opened from disk. The tracks after it are
+        then read ahead, into the TrackBuffer and the OS's page cache.
+        skipped is whether the file is being played because of a skip.
+        """
+        self.take_audio()
+        buffered = self.buffer.take(self.current_file.filepath, skipped)\
+            if self.buffer is not None else None
         try:
-            mixer.init(self.current_file.sample_rate)
+            self.audio.prepare(
+                buffered.sample_rate
+                if buffered is not None and buffered.sample_rate
+                else self.current_file.sample_rate
+            )
         except (ValueError, TypeError):
             log.info(
                 "TinyTag couldn't parse the tags for %s"
                 % self.current_file.filepath
             )
             self.skip()
-            self.begin_playback()
+            self.begin_playback(skipped)
+            return
         try:
             log.debug(
                 f"Attempting to begin playback of {self.current_file.filepath}"
             )
-            mixer.music.load(self.current_file.filepath)
-            mixer.music.play()
+            if buffered is None:
+                self.audio.load(self.current_file.filepath)
+            else:
+                self.audio.load(BytesIO(buffered.data), buffered.namehint)
+            self.gain = self.track_gain(self.current_file.filepath)
+            self.apply_volume()
+            self.audio.play()
             self.paused = False
-        except PyGameError:
+            self.started = self.current_file.filepath
+            if self.history is not None:
+                self.history.record(PLAYED, self.started)
+        except self.audio.error:
             self.skip()
-            self.begin_playback()
+            self.begin_playback(skipped)
+            return
+        if self.buffer is not None:
+            self.buffer.prefetch(
+                self.shuffle.upcoming(Config.prefetch_lookahead)
+            )
+        if self.readahead is not None:
+            self.readahead.advise(
+                self.shuffle.upcoming(Config.readahead_lookahead), id(self)
+            )
+
+    def schedule_playback(self):
+        """Begin playback, unless the player is in the middle of skipping.
+
+        A skip plays its track straight away. Any more skips within
+        Config.skip_debounce seconds only move through the shuffle order,
+        and each restarts the timer; once it runs out, the track they ended
+        on is loaded. So a burst of skips loads two tracks, not one for
+        every skip.
+        """
+        if not Config.skip_debounce:
+            self.begin_playback(True)
+            return
+        with self.lock:
+            if self.pending_playback is None:
+                self.begin_playback(True)
+                self.skipped_while_pending = False
+            else:
+                self.pending_playback.cancel()
+                self.skipped_while_pending = True
+            timer = Timer(Config.skip_debounce, self._deferred_playback)
+            timer.daemon = True
+            self.pending_playback = timer
+            timer.start()
+
+    def _deferred_playback(self):
+        with self.lock:
+            if self.pending_playback is not current_thread():
+                # Superseded while waiting for the lock.
+                return
+            self.pending_playback = None
+            if self.skipped_while_pending:
+                self.begin_playback(True)
 
-    @strict
     def displayed_text(
                 self, maxcolumns: Union[str, int], maxlines: Union[str, int]
             ) -> Dict[str, Dict[str, int]]:
         """Retrieve the text to display and where to display it."""
-        text = {}
-        song_txt_list = wrap(                   # wrap the text to be one-third
-            self.song_info, int(int(maxcolumns)/3)   # of the width of the window.
-        )
-        for lineno in range(len(song_txt_list)):
-            text.update({
-                song_txt_list[lineno]: {
-                    'x': int(
-                        (int(maxcolumns) - len(song_txt_list[lineno])) / 2
-                    ),
-                    'y': int((int(maxlines)-len(song_txt_list)) / 2 + lineno)
-                }
-            })
+        text = dict(self.current_file.layout(int(maxcolumns), int(maxlines)))
         text.update({
             self.current_time: {
                 'x': 2,
@@ -377,8 +773,10 @@ class Player:
 
     def stop_drop_and_roll(self):
         log.debug("Stopping and exiting")
-        mixer.music.stop()
-        mixer.quit()
+        self.audio.stop()
+        self.audio.quit()
+        if self.history is not None:
+            self.history.close()
         exit(0)
 
 
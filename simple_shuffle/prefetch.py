@@ -0,0 +1,153 @@
+"""Load upcoming tracks into memory ahead of time.
+
+Skipping otherwise has to open the next file and read its header from disk
+at the moment the button is pressed. The TrackBuffer reads the next few
+files of the shuffle order on a background thread, within a memory budget,
+so that Player.begin_playback can hand the mixer an in-memory stream. The
+files are kept encoded, so decoding still starts when the track is played;
+what's saved is waiting on the disk. Unlike the page cache, which ReadAhead
+warms further ahead, the buffer can't be dropped by the OS under pressure.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os.path import getsize, splitext
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional
+from strict_hint import strict
+from simple_shuffle.config import Config
+
+
+log = Config.logger
+
+
+class BufferedTrack(NamedTuple):
+    """The contents of a file which has been read ahead of time."""
+    filepath: str
+    data: bytes
+    sample_rate: Optional[int]
+
+    @property
+    def namehint(self) -> str:
+        """The file extension, which pygame uses to pick a decoder."""
+        return splitext(self.filepath)[1].lstrip('.')
+
+
+class TrackBuffer:
+    """An LRU buffer of upcoming tracks with a bounded memory budget."""
+    @strict
+    def __init__(self, budget: int, workers: int=1):
+        self.budget = budget
+        self.used = 0
+        self.tracks: Dict[str, BufferedTrack] = OrderedDict()
+        self.pending = set()
+        # Files which were played while they were still being read.
+        self.unwanted = set()
+        self.hits = 0
+        self.misses = 0
+        self.late = 0
+        self.lock = Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def __contains__(self, filepath):
+        with self.lock:
+            return filepath in self.tracks
+
+    @strict
+    def prefetch(self, filepaths: List[str]) -> None:
+        """Start reading the given files in the background."""
+        for filepath in filepaths:
+            with self.lock:
+                if filepath in self.tracks:
+                    # Still wanted; don't let it be evicted first.
+                    self.tracks.move_to_end(filepath)
+                    continue
+                if filepath in self.pending:
+                    self.unwanted.discard(filepath)
+                    continue
+                self.pending.add(filepath)
+            self.pool.submit(self._load, filepath)
+
+    def _load(self, filepath: str) -> None:
+        try:
+            size = getsize(filepath)
+            if size > self.budget:
+                log.debug("%s is too big to buffer (%d bytes)", filepath, size)
+                return
+            with open(filepath, 'rb') as file:
+                data = file.read()
+            try:
+                sample_rate = sample_rate_of(filepath)
+            except ValueError:
+                sample_rate = None
+            with self.lock:
+                if filepath in self.unwanted:
+                    return
+                self._evict(len(data))
+                self.tracks[filepath] = BufferedTrack(
+                    filepath, data, sample_rate
+                )
+                self.used += len(data)
+        except OSError as err:
+            log.info("Unable to buffer %s: %s", filepath, err)
+        finally:
+            with self.lock:
+                self.pending.discard(filepath)
+                self.unwanted.discard(filepath)
+
+    def _evict(self, needed: int) -> None:
+        """Drop the least recently wanted tracks until needed bytes fit."""
+        while self.tracks and self.used + needed > self.budget:
+            _, track = self.tracks.popitem(last=False)
+            self.used -= len(track.data)
+
+    def take(self, filepath: str,
+             skipped: bool=False) -> Optional[BufferedTrack]:
+        """Remove and return the buffered contents of filepath, if present.
+
+        Only tracks which were skipped to count towards the stats; a track
+        which follows one that ended had all of that one to be read in.
+        """
+        with self.lock:
+            track = self.tracks.pop(filepath, None)
+            if track is not None:
+                self.used -= len(track.data)
+            if filepath in self.pending:
+                # Don't keep it once it's read; it's already playing.
+                self.unwanted.add(filepath)
+            if skipped:
+                if track is not None:
+                    self.hits += 1
+                elif filepath in self.pending:
+                    self.late += 1
+                else:
+                    self.misses += 1
+            return track
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """How often a track was ready in the buffer when it was skipped to.
+
+        Tracks which were still being read are counted as late, rather than
+        as misses.
+        """
+        with self.lock:
+            total = self.hits + self.misses + self.late
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "late": self.late,
+                "hit_rate": self.hits / total if total else 0.0,
+                "buffered": len(self.tracks),
+                "bytes_used": self.used,
+                "budget": self.budget,
+            }
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+def sample_rate_of(filepath: str) -> int:
+    """Get the sample rate of a file, raising ValueError if it's unknown."""
+    # Imported here to avoid an import cycle with the player module.
+    from simple_shuffle.player import PlayingFile
+    return PlayingFile(filepath).sample_rate
@@ -0,0 +1,121 @@
+"""Warm the page cache with the files which are about to be played.
+
+When the library is on a disk which has spun down, or on NFS, opening the
+next track can block for seconds. The TrackBuffer only holds the next track
+or two in memory; ReadAhead asks the kernel to read a longer window of the
+shuffle order into its page cache (posix_fadvise WILLNEED) on a background
+thread while the current track plays. The window has a budget of bytes, so
+a few large FLACs don't push everything else out of the cache: files near
+the front of the window are warmed first, and once the budget runs out the
+rest get only as much as is left, or nothing. Players sharing a ReadAhead
+(zones) each have a window, and share the budget between them.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from threading import Lock
+from typing import Dict, List
+from strict_hint import strict
+from simple_shuffle.config import Config
+
+
+log = Config.logger
+WILLNEED = getattr(os, "POSIX_FADV_WILLNEED", None)
+CHUNK = 1024 * 1024
+
+
+@strict
+def warm(filepath: str, limit: int) -> int:
+    """Start reading up to limit bytes of a file into the page cache.
+
+    Returns how many bytes were asked for. Without posix_fadvise (macOS,
+    Windows) the bytes are read and thrown away, which has the same effect
+    but only returns once they've been read.
+    """
+    descriptor = os.open(filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        length = min(os.fstat(descriptor).st_size, limit)
+        if WILLNEED is not None:
+            os.posix_fadvise(descriptor, 0, length, WILLNEED)
+            return length
+        remaining = length
+        while remaining > 0:
+            chunk = os.read(descriptor, min(CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        return length - remaining
+    finally:
+        os.close(descriptor)
+
+
+class ReadAhead:
+    """Keep windows of upcoming files warm, within a budget of bytes."""
+    @strict
+    def __init__(self, budget: int):
+        self.budget = budget
+        # The bytes asked for of each file in the windows.
+        self.advised: Dict[str, int] = {}
+        # The files in each player's window, in the order they'll be played.
+        self.windows: Dict[int, List[str]] = {}
+        self.scheduled = False
+        self.lock = Lock()
+        self.pool = ThreadPoolExecutor(max_workers=1)
+
+    @strict
+    def advise(self, filepaths: List[str], window: int=0) -> None:
+        """Make filepaths, in the order they'll be played, a window.
+
+        Each player sharing the ReadAhead should use a window of its own,
+        such as its id(), so that it doesn't replace the others'.
+        """
+        with self.lock:
+            scheduled = self.scheduled
+            self.windows[window] = filepaths
+            self.scheduled = True
+        # A burst of skips only warms the window it ends on.
+        if not scheduled:
+            self.pool.submit(self._advise)
+
+    def _advise(self) -> None:
+        with self.lock:
+            self.scheduled = False
+            # Take turns between the windows, so the front of each one is
+            # warmed before the back of any.
+            filepaths = list(dict.fromkeys(
+                filepath
+                for turn in zip_longest(*self.windows.values())
+                for filepath in turn if filepath is not None
+            ))
+        # Files which have left every window (the ones now playing, ones
+        # which were skipped past) no longer count against the budget.
+        advised = {
+            filepath: self.advised[filepath] for filepath in filepaths
+            if filepath in self.advised
+        }
+        remaining = self.budget - sum(advised.values())
+        for filepath in filepaths:
+            if remaining <= 0:
+                break
+            if filepath in advised:
+                continue
+            try:
+                advised[filepath] = warm(filepath, remaining)
+            except OSError as err:
+                log.info("Unable to read ahead %s: %s", filepath, err)
+                continue
+            remaining -= advised[filepath]
+        self.advised = advised
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """How much of the window has been asked for."""
+        advised = self.advised
+        return {
+            "files": len(advised),
+            "bytes": sum(advised.values()),
+            "budget": self.budget,
+        }
+
+    def close(self):
+        self.pool.shutdown(wait=False)
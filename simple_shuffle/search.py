@@ -0,0 +1,212 @@
+"""Find tracks in the library by artist, album, title or filename.
+
+The TagIndex is an inverted index from lowercased words to the tracks they
+appear in. It's built on a background thread, reading tags from the
+FileCache where possible so only new or changed files are opened.
+
+The index is split into shards of SHARD_SIZE consecutive tracks. In each,
+words are kept sorted and their posting lists laid end to end in the same
+order, so the tracks with a word starting with a prefix are one slice of
+an array, found with a binary search. A search intersects those slices a
+shard at a time, in library order, so a query with plenty of results stops
+after the first shard or two.
+"""
+import re
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Thread
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from tinytag import TinyTag, TinyTagException
+from strict_hint import strict
+from simple_shuffle.cache import FileCache
+from simple_shuffle.config import Config
+from simple_shuffle.player import get_filename
+
+
+log = Config.logger
+KIND = "tags"
+BATCH_SIZE = 512
+SHARD_SIZE = 16384
+# Roughly how many postings can be intersected in the time it takes to look
+# up one track's words.
+LOOKUP_COST = 32
+WORD = re.compile(r"\w+")
+TAG_NAMES = ("artist", "album", "title")
+
+
+class SearchResult(NamedTuple):
+    filepath: str
+    text: str
+
+
+def read_tags(filepath: str) -> Dict[str, Optional[str]]:
+    """Read just the tags which are indexed from a file."""
+    try:
+        tags = TinyTag.get(filepath)
+    except (TinyTagException, LookupError, OSError, ValueError):
+        return {}
+    return {name: getattr(tags, name, None) for name in TAG_NAMES}
+
+
+def words(text: str) -> List[str]:
+    return WORD.findall(text.lower())
+
+
+def describe(tags: Dict[str, Optional[str]], filepath: str) -> str:
+    """A short description of a track to show in search results."""
+    title, artist = tags.get("title"), tags.get("artist")
+    if title is None:
+        return get_filename(filepath)
+    return title if artist is None else "%s by %s" % (title, artist)
+
+
+class Shard:
+    """The words in a run of consecutive tracks, and which tracks they're in.
+
+    postings holds the track ids of each word in words, one after another;
+    those of words[i] are from offsets[i] up to offsets[i + 1]. The other
+    way round, track_words holds the (sorted) numbers in words of each
+    track's words; those of track first + i are from track_offsets[i] up
+    to track_offsets[i + 1].
+    """
+    def __init__(self, first: int, found: List[frozenset]):
+        """Index the words found in each track, from track id first on."""
+        postings = defaultdict(list)
+        for track_id, track_words in enumerate(found, first):
+            for word in track_words:
+                postings[word].append(track_id)
+        self.first = first
+        self.words = sorted(postings)
+        self.postings = array('L')
+        self.offsets = array('Q', [0])
+        for word in self.words:
+            self.postings.extend(postings[word])
+            self.offsets.append(len(self.postings))
+        numbers = {word: number for number, word in enumerate(self.words)}
+        self.track_words = array('L')
+        self.track_offsets = array('Q', [0])
+        for track_words in found:
+            self.track_words.extend(sorted(
+                numbers[word] for word in track_words
+            ))
+            self.track_offsets.append(len(self.track_words))
+
+    def word_range(self, prefix: str) -> Tuple[int, int]:
+        """Where the words starting with prefix are in words."""
+        start = bisect_left(self.words, prefix)
+        return start, bisect_left(self.words, prefix + "\U0010ffff", start)
+
+    def has_word_in(self, track_id: int, start: int, end: int) -> bool:
+        """Whether one of a track's words is numbered from start to end."""
+        low = self.track_offsets[track_id - self.first]
+        high = self.track_offsets[track_id - self.first + 1]
+        index = bisect_left(self.track_words, start, low, high)
+        return index < high and self.track_words[index] < end
+
+    def search(self, prefixes: List[str]) -> set:
+        """The tracks with a word starting with each of prefixes.
+
+        The tracks of the prefix with the fewest postings are narrowed down
+        by each of the others, from the fewest up: by intersecting with the
+        other's postings, or once there are only a few tracks left, by
+        looking each one's words up.
+        """
+        ranges = sorted(
+            (self.word_range(prefix) for prefix in prefixes),
+            key=lambda words: self.offsets[words[1]] - self.offsets[words[0]]
+        )
+        start, end = ranges[0]
+        found = set(self.postings[self.offsets[start]:self.offsets[end]])
+        for start, end in ranges[1:]:
+            if not found:
+                break
+            low, high = self.offsets[start], self.offsets[end]
+            if len(found) * LOOKUP_COST < high - low:
+                found = {
+                    track_id for track_id in found
+                    if self.has_word_in(track_id, start, end)
+                }
+            else:
+                found.intersection_update(self.postings[low:high])
+        return found
+
+
+class TagIndex:
+    """An inverted index over the tags and filenames of the library."""
+    def __init__(self, files: List[str], cache: Optional[FileCache]=None):
+        self.files = files
+        self.cache = cache
+        self.ids: Dict[str, int] = {}
+        self.texts: List[str] = []
+        self.shards: List[Shard] = []
+        self.ready = False
+
+    def start(self) -> Thread:
+        """Build the index on a background thread."""
+        thread = Thread(target=self.build, name="TagIndex", daemon=True)
+        thread.start()
+        return thread
+
+    def build(self):
+        """Read the tags of every file and index them."""
+        # The words of each track which isn't in a shard yet.
+        unsharded: List[frozenset] = []
+        for start in range(0, len(self.files), BATCH_SIZE):
+            batch = self.files[start:start + BATCH_SIZE]
+            cached = self.cache.get_many(KIND, batch) if self.cache else {}
+            fresh = {
+                filepath: read_tags(filepath) for filepath in batch
+                if filepath not in cached
+            }
+            if self.cache and fresh:
+                self.cache.put_many(KIND, fresh)
+            cached.update(fresh)
+            for filepath in batch:
+                tags = cached[filepath]
+                track_id = len(self.texts)
+                self.ids[filepath] = track_id
+                self.texts.append(describe(tags, filepath))
+                unsharded.append(frozenset(
+                    word for text in (
+                        *(tags.get(name) for name in TAG_NAMES),
+                        get_filename(filepath)
+                    ) if text for word in words(str(text))
+                ))
+                if len(unsharded) == SHARD_SIZE:
+                    self.shards.append(
+                        Shard(track_id + 1 - SHARD_SIZE, unsharded)
+                    )
+                    unsharded = []
+        if unsharded:
+            self.shards.append(
+                Shard(len(self.texts) - len(unsharded), unsharded)
+            )
+        self.ready = True
+        log.info(
+            "Indexed %d tracks in %d shards",
+            len(self.texts), len(self.shards)
+        )
+
+    @strict
+    def search(self, query: str, limit: int=50) -> List[SearchResult]:
+        """Find tracks with a word starting with each word of the query.
+
+        Returns the first limit of them in library order, searching only
+        as many shards as it takes to find them.
+        """
+        if not self.ready:
+            raise LookupError("The search index isn't ready yet.")
+        prefixes = words(query)
+        if not prefixes:
+            return []
+        results = []
+        for shard in self.shards:
+            found = sorted(shard.search(prefixes))
+            results.extend(
+                SearchResult(self.files[track_id], self.texts[track_id])
+                for track_id in found[:limit - len(results)]
+            )
+            if len(results) >= limit:
+                break
+        return results
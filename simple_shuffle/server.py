@@ -1,56 +1,21 @@
 #!/usr/bin/env python3
 """Begin the simple_shuffle and watch for commands on a port."""
-from flask import Flask, request, Response
-from simple_shuffle.player import Player
+from flask import Flask, abort, request, Response
+from simple_shuffle.player import Library, Player
 from os.path import join as getpath
 from os import environ
+from threading import Event, Thread
 from json import dumps
 from strict_hint import strict
-from typing import Tuple, Union
+from typing import Callable, Dict, Optional, Tuple
 from simple_shuffle.config import Config
+from simple_shuffle.search import TagIndex
+from simple_shuffle.frozen import FrozenDetector
+from simple_shuffle.audio import get_backend
+from simple_shuffle.permutation import derive_seed
+from simple_shuffle.history import TrackStats
 
 
-class FrozenDetector:
-    """Detect that playback has stalled."""
-    def __init__(self):
-        Config.logger.debug("Initializing the FrozenDetector")
-        self.same_counter: int = 0
-        self.time_value: int = 0
-
-    @strict
-    def check(self, time: Union[int, str, float]) -> bool:
-        """Get whether or not the time has been the same for too long.
-
-        "Too long" is defined in config.py as Config.frozen_threshold. The
-        method returns a boolean based on whether or not it's "frozen".
-
-        time is converted internally to an int, so using a value like "Seven"
-        will throw a ValueError and a value like 1.04309 will cause
-        unpredicatble results.
-        """
-        Config.logger.debug(
-            "Checking if frozen. Time: %d; Stored time: %d; Counter %d",
-            int(time),
-            self.time_value,
-            self.same_counter
-        )
-        if self.time_value == int(time):
-            self.same_counter += 1
-        self.time_value = int(time)
-        if self.same_counter >= Config.frozen_threshold:
-            Config.logger.warn(
-                "Frozen! Time: %d; Stored time: %d; Counter %d",
-                int(time),
-                self.time_value,
-                self.same_counter
-            )
-            return True
-        return False
-
-    def reset(self):
-        self.same_counter = 0
-        self.time_value = 0
-
 # class PlayerServer(Flask):
 #     """The Flask server object to pair with the player."""
 #     def __init__(self, import_name, player, *args, **kwargs):
@@ -59,45 +24,165 @@ class FrozenDetector:
 #         super().__init__(import_name, *args, **kwargs)
 
 
-try:
-    player = Player(environ['simple_shuffle_folder'])
-except KeyError:
+DEFAULT_ZONE = "default"
+library: Optional[Library] = None
+zones: Dict[str, Player] = {}
+player: Optional[Player] = None
+index: Optional[TagIndex] = None
+loaded = Event()
+load_error: Optional[str] = None
+
+app = Flask(__name__)
+frozen: Dict[str, FrozenDetector] = {}
+
+
+def default_folder() -> str:
+    """The folder to shuffle, from the environment."""
     try:
-        player = Player(getpath(environ['HOME'], "Music"))
+        return environ['simple_shuffle_folder']
     except KeyError:
-        player = Player(getpath('/', 'home', environ['USER'], "Music"))
+        try:
+            return getpath(environ['HOME'], "Music")
+        except KeyError:
+            return getpath('/', 'home', environ['USER'], "Music")
 
-app = Flask(__name__)
-frozen = FrozenDetector()
+
+def load(folder: str):
+    """Scan the library and start the players.
+
+    This is run on a background thread, so that the server can accept
+    requests (and answer /ready) as soon as it's started.
+    """
+    global library, player, index, load_error
+    try:
+        library = Library(folder)
+        # Every zone shuffles the same library, but has its own order, queue,
+        # volume and audio output. Only the default zone starts playing
+        # straight away.
+        zones.update({
+            name: Player(
+                library.folder,
+                name == DEFAULT_ZONE,
+                library,
+                get_backend(
+                    separate=name != DEFAULT_ZONE,
+                    device=Config.zone_devices.get(name, "")
+                ),
+                *zone_shuffle(name)
+            ) for name in (DEFAULT_ZONE, *Config.zones)
+        })
+        frozen.update({name: FrozenDetector() for name in zones})
+        player = zones[DEFAULT_ZONE]
+        index = TagIndex(list(library.files), library.cache)
+        index.start()
+    except Exception as err:
+        load_error = "Unable to load %s: %s" % (folder, err)
+        Config.logger.exception(load_error)
+    finally:
+        loaded.set()
+
+
+def zone_shuffle(zone: str) -> Tuple[Optional[int], int]:
+    """The seed and index a zone's permutation shuffle starts from.
+
+    The default zone resumes from Config.shuffle_seed and shuffle_index.
+    Other zones get a seed derived from that one, so that they don't all
+    play the same order, but are still reproducible.
+    """
+    if zone == DEFAULT_ZONE:
+        return Config.shuffle_seed, Config.shuffle_index
+    if Config.shuffle_seed is None:
+        return None, 0
+    return derive_seed(Config.shuffle_seed, zone), 0
+
+
+loader = Thread(
+    target=load, args=(default_folder(),), name="loader", daemon=True
+)
+loader.start()
 
 
 @app.before_request
-def check_frozen():
-    """Check to see if the player is frozen."""
-    if player.paused:
-        if frozen.check(player.current_position):
-            player.skip()
-            player.begin_playback()
-            frozen.reset()
+def require_ready():
+    """Respond 503 to everything but /ready until the library is loaded."""
+    if request.endpoint == "ready":
+        return None
+    if not loaded.is_set():
+        return 'The library is still loading', 503, {"Retry-After": "1"}
+    if load_error is not None:
+        return load_error, 500
+
 
+def ready() -> Tuple[str, int]:
+    """Respond 200 once the library is loaded, 503 until then.
+
+    If the library couldn't be loaded, respond 500 with the reason.
+    """
+    if not loaded.is_set():
+        return 'loading', 503
+    if load_error is not None:
+        return load_error, 500
+    return 'ready', 200
+app.add_url_rule("/ready", "ready", ready)
 
-def isplaying() -> Tuple[str, int]:
+
+@strict
+def get_zone(zone: str) -> Player:
+    """Get the player for a zone, or respond 404 if there isn't one."""
+    try:
+        return zones[zone]
+    except KeyError:
+        abort(404, "No zone named %s" % zone)
+
+
+def add_zone_rule(rule: str, view: Callable, **options):
+    """Route a command to the default zone, and to each zone by name."""
+    app.add_url_rule("/" + rule, view.__name__, view, **options)
+    app.add_url_rule(
+        "/zones/<zone>/" + rule, view.__name__, view, **options
+    )
+
+
+@app.before_request
+def check_frozen():
+    """Check to see if any player which is being heard is frozen."""
+    if not loaded.is_set():
+        # The loader thread is still adding the zones.
+        return
+    for name, detector in frozen.items():
+        player = zones[name]
+        if player.owns_audio and player.paused:
+            if detector.check(player.current_position):
+                player.skip()
+                player.begin_playback()
+                detector.reset()
+
+
+def zone_names() -> str:
+    """List the names of the zones."""
+    return dumps(list(zones))
+app.add_url_rule("/zones", "zones", zone_names)
+
+
+def isplaying(zone: str=DEFAULT_ZONE) -> Tuple[str, int]:
     """Get whether or not the player is paused with HTTP response codes.
 
     Returns 200/OK if the player is playing now, '204/No Content' if it's
     paused.
     """
+    player = get_zone(zone)
     if not player.paused:
         return '', 204
     return '', 200
-app.add_url_rule("/isplaying", "isplaying", isplaying)
+add_zone_rule("isplaying", isplaying)
 
 
-def pause_unpause() -> str:
+def pause_unpause(zone: str=DEFAULT_ZONE) -> str:
     """Call Player.pause_unpause on the thread."""
+    player = get_zone(zone)
     player.pause_unpause()
     return ''
-app.add_url_rule("/pause_unpause", "pause_unpause", pause_unpause)
+add_zone_rule("pause_unpause", pause_unpause)
 
 
 def stop_drop_and_roll():
@@ -112,76 +197,96 @@ app.add_url_rule("/stop", "stop_drop_and_roll", stop_drop_and_roll)
 
 
 @strict
-def skip() -> str:
+def skip(zone: str=DEFAULT_ZONE) -> str:
     """Call Player.skip on the thread."""
-    player.skip()
-    player.begin_playback()
+    player = get_zone(zone)
+    with player.lock:
+        player.record_skip()
+        player.skip()
+        player.schedule_playback()
     return ''
-app.add_url_rule("/skip", "skip", skip)
+add_zone_rule("skip", skip)
 
 
 @strict
-def previous() -> str:
+def previous(zone: str=DEFAULT_ZONE) -> str:
     """Call Player.previous on the thread."""
-    player.previous()
-    player.begin_playback()
+    player = get_zone(zone)
+    with player.lock:
+        player.previous()
+        player.schedule_playback()
     return ''
-app.add_url_rule("/previous", "previous", previous)
+add_zone_rule("previous", previous)
 
 
 @strict
-def current_volume() -> str:
+def current_volume(zone: str=DEFAULT_ZONE) -> str:
     """Retrieve the current volume as a str of a float between 0 and 1."""
+    player = get_zone(zone)
     return str(player.current_volume)
-app.add_url_rule("/current_volume", "current_volume", current_volume)
+add_zone_rule("current_volume", current_volume)
 
 
 @strict
-def volume_up() -> str:
+def volume_up(zone: str=DEFAULT_ZONE) -> str:
     """Call Player.volume_up on the thread."""
+    player = get_zone(zone)
     player.volume_up()
     return ''
-app.add_url_rule("/volume_up", "volume_up", volume_up)
+add_zone_rule("volume_up", volume_up)
 
 
 @strict
-def volume_down() -> str:
+def volume_down(zone: str=DEFAULT_ZONE) -> str:
     """Call Player.volume_down on the thread."""
+    player = get_zone(zone)
     player.volume_down()
     return ''
-app.add_url_rule("/volume_down", "volume_down", volume_down)
+add_zone_rule("volume_down", volume_down)
 
 
 @strict
-def current_position() -> str:
+def current_position(zone: str=DEFAULT_ZONE) -> str:
     """Return the current time as milliseconds."""
+    player = get_zone(zone)
     return str(player.current_position)
-app.add_url_rule("/current_position", "current_position", current_position)
+add_zone_rule("current_position", current_position)
 
 
 @strict
-def current_time() -> str:
+def current_time(zone: str=DEFAULT_ZONE) -> str:
     """Return the current time as M:SS format."""
+    player = get_zone(zone)
     return player.current_time
-app.add_url_rule("/current_time", "current_time", current_time)
+add_zone_rule("current_time", current_time)
 
 
 @strict
-def song_info() -> str:
+def song_info(zone: str=DEFAULT_ZONE) -> str:
     """Get just the song-info text generated from the tags or filename."""
+    player = get_zone(zone)
     return player.song_info
-app.add_url_rule("/song_info", "song_info", song_info)
+add_zone_rule("song_info", song_info)
 
 
 @strict
-def current_file() -> str:
+def song_info_short(zone: str=DEFAULT_ZONE) -> str:
+    """Get just the title and artist, without the track or album."""
+    player = get_zone(zone)
+    return player.song_info_short
+add_zone_rule("song_info_short", song_info_short)
+
+
+@strict
+def current_file(zone: str=DEFAULT_ZONE) -> str:
     """Retrieve the current filename."""
+    player = get_zone(zone)
     return player.current_file.filepath
-app.add_url_rule("/current_file", "current_file", current_file)
+add_zone_rule("current_file", current_file)
 
 
 @strict
-def displayed_text() -> str:
+def displayed_text(zone: str=DEFAULT_ZONE) -> str:
     """Retrieve the current text to display, given lines and columns.
 
     This is for the curses client, other clients should implement different
@@ -189,12 +294,204 @@ def displayed_text() -> str:
     unless lines and columns are convenient, but I really can't see another
     use for that outside of curses.
     """
+    player = get_zone(zone)
     return dumps(player.displayed_text(
         maxcolumns=request.args.get("x", 25),
         maxlines=request.args.get("y", 25)
     ))
-app.add_url_rule("/displayed_text", "displayed_text", displayed_text)
+add_zone_rule("displayed_text", displayed_text)
+
+
+def shuffle_state(zone: str=DEFAULT_ZONE) -> Tuple[str, int]:
+    """Get the (seed, index) pair that the shuffle order can be resumed from.
+
+    Only a permutation-mode shuffle can be resumed this way; otherwise
+    respond with 404.
+    """
+    player = get_zone(zone)
+    try:
+        seed, index = player.shuffle.state
+    except AttributeError:
+        return '', 404
+    return dumps({"seed": seed, "index": index}), 200
+add_zone_rule("shuffle_state", shuffle_state)
+
+
+def buffer_stats() -> Tuple[str, int]:
+    """Get how often skips were served from the read-ahead buffer.
+
+    If the page cache is being warmed too, how much of the upcoming tracks
+    has been asked for is under "readahead".
+    """
+    if library.buffer is None and library.readahead is None:
+        return '', 404
+    stats = library.buffer.stats if library.buffer is not None else {}
+    if library.readahead is not None:
+        stats["readahead"] = library.readahead.stats
+    return dumps(stats), 200
+app.add_url_rule("/buffer_stats", "buffer_stats", buffer_stats)
+
+
+def search() -> Tuple[str, int]:
+    """Find tracks whose tags or filename have words starting with q.
+
+    Responds with a JSON list of {"file": ..., "text": ...} objects, or 503
+    while the index is still being built.
+    """
+    try:
+        limit = int(request.args.get("limit", 50))
+    except ValueError:
+        return 'Invalid limit', 400
+    if limit < 1:
+        return 'Invalid limit', 400
+    try:
+        results = index.search(request.args.get("q", ""), limit)
+    except LookupError:
+        return 'The search index is still being built', 503
+    return dumps([
+        {"file": result.filepath, "text": result.text} for result in results
+    ]), 200
+app.add_url_rule("/search", "search", search)
+
+
+def stats() -> Tuple[str, int]:
+    """Get statistics from the play history.
+
+    With ?file=, how often that file has been played and skipped. With
+    ?recent=N, the last N plays and skips. Otherwise, the ?top= (10) files
+    with the most plays, or ordered ?by= skips or last_played.
+    """
+    history = library.history
+    if history is None:
+        return 'The play history is turned off', 404
+    try:
+        if "file" in request.args:
+            return dumps(track_stats(history.track(request.args["file"]))), 200
+        if "recent" in request.args:
+            return dumps([
+                {"time": when, "file": filepath, "event": event}
+                for when, filepath, event in
+                history.recent(int(request.args["recent"]))
+            ]), 200
+        return dumps([
+            track_stats(track) for track in history.top(
+                int(request.args.get("top", 10)),
+                request.args.get("by", "plays")
+            )
+        ]), 200
+    except ValueError as err:
+        return str(err), 400
+app.add_url_rule("/stats", "stats", stats)
+
+
+def track_stats(track: TrackStats) -> dict:
+    return {
+        "file": track.filepath,
+        "plays": track.plays,
+        "skips": track.skips,
+        "last_played": track.last_played,
+    }
+
+
+def play_next(zone: str=DEFAULT_ZONE) -> Tuple[str, int]:
+    """Queue a file from the library, given as ?file=, to be played next."""
+    return queue_add(zone, position=0)
+add_zone_rule("play_next", play_next)
+
+
+def queue(zone: str=DEFAULT_ZONE) -> str:
+    """List the queued files in the order they'll be played."""
+    player = get_zone(zone)
+    return dumps(list(player.shuffle.queued))
+add_zone_rule("queue", queue)
+
+
+def queue_add(
+            zone: str=DEFAULT_ZONE, position: Optional[int]=None
+        ) -> Tuple[str, int]:
+    """Queue a file from the library, given as ?file=.
+
+    It's added to the end of the queue, or at ?position= if that's given.
+    """
+    player = get_zone(zone)
+    filepath = request.args.get("file")
+    if filepath not in library:
+        return 'Not in the library: %s' % filepath, 404
+    try:
+        if position is None and "position" in request.args:
+            position = int(request.args["position"])
+    except ValueError:
+        return 'Invalid position', 400
+    player.shuffle.enqueue(filepath, position)
+    return '', 200
+add_zone_rule("queue/add", queue_add)
+
+
+def queue_remove(zone: str=DEFAULT_ZONE) -> Tuple[str, int]:
+    """Remove the file at ?position= from the queue, and respond with it."""
+    player = get_zone(zone)
+    try:
+        return player.shuffle.remove(int(request.args["position"])), 200
+    except (KeyError, ValueError):
+        return 'Invalid position', 400
+    except IndexError:
+        return 'Nothing queued at that position', 404
+add_zone_rule("queue/remove", queue_remove)
+
+
+def queue_move(zone: str=DEFAULT_ZONE) -> Tuple[str, int]:
+    """Move the file at ?from= in the queue to ?to=."""
+    player = get_zone(zone)
+    try:
+        player.shuffle.move(
+            int(request.args["from"]), int(request.args["to"])
+        )
+    except (KeyError, ValueError):
+        return 'Invalid position', 400
+    except IndexError:
+        return 'Nothing queued at that position', 404
+    return '', 200
+add_zone_rule("queue/move", queue_move)
+
+
+def queue_clear(zone: str=DEFAULT_ZONE) -> str:
+    """Remove everything from the queue."""
+    player = get_zone(zone)
+    player.shuffle.clear()
+    return ''
+add_zone_rule("queue/clear", queue_clear)
+
+
+def commands(zone: str=DEFAULT_ZONE) -> Tuple[str, int]:
+    """Run several commands in one request.
+
+    Expects a JSON list of command names, e.g. ["skip", "skip", "song_info"],
+    which are run in order. Responds with a JSON list of each command's
+    response body, or 400 and the first unknown command.
+    """
+    get_zone(zone)
+    batch = request.get_json(force=True, silent=True)
+    if not isinstance(batch, list):
+        return 'Expected a JSON list of commands', 400
+    for command in batch:
+        if not isinstance(command, str) or command not in batch_commands:
+            return dumps({"unknown_command": command}), 400
+    results = []
+    for command in batch:
+        result = batch_commands[command](zone)
+        results.append(result[0] if isinstance(result, tuple) else result)
+    return dumps(results), 200
+add_zone_rule("commands", commands, methods=["POST"])
+
+
+batch_commands = {
+    function.__name__: function for function in (
+        pause_unpause, skip, previous, current_volume, volume_up,
+        volume_down, current_position, current_time, song_info,
+        song_info_short, current_file
+    )
+}
 
 
 if __name__ == '__main__':
-    app.run(host="127.0.0.1", port=21212)
+    app.run(host=Config.server_host, port=Config.server_port)
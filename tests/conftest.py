@@ -0,0 +1,52 @@
+"""Fixtures shared by the tests.
+
+simple_shuffle reads its configuration from the environment when it's
+imported, so the cache is pointed at a scratch directory, and SDL at its
+dummy audio driver, before any of it is.
+"""
+import math
+import os
+import shutil
+import struct
+import tempfile
+import wave
+import pytest
+
+scratch = tempfile.mkdtemp(prefix="simple_shuffle-tests-")
+os.environ["simple_shuffle_cache"] = os.path.join(scratch, "cache.sqlite")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+TRACKS = 6
+
+
+def write_wav(filepath: str, frequency: float, seconds: float=0.25,
+              sample_rate: int=22050):
+    """Write a mono 16-bit sine wave."""
+    with wave.open(filepath, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(sample_rate)
+        output.writeframes(b"".join(
+            struct.pack(
+                "<h",
+                int(8000 * math.sin(2 * math.pi * frequency * n / sample_rate))
+            ) for n in range(int(seconds * sample_rate))
+        ))
+
+
+@pytest.fixture
+def music(tmp_path) -> str:
+    """A folder of TRACKS different WAVs in two albums, and one duplicate."""
+    for number in range(TRACKS):
+        album = tmp_path / ("album%d" % (number % 2))
+        album.mkdir(exist_ok=True)
+        write_wav(str(album / ("track%d.wav" % number)), 220 * (number + 1))
+    shutil.copy(
+        str(tmp_path / "album0" / "track0.wav"),
+        str(tmp_path / "album1" / "copy of track0.wav")
+    )
+    return str(tmp_path)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(scratch, ignore_errors=True)
@@ -0,0 +1,52 @@
+"""Tests for the seeded permutation shuffle mode."""
+import pytest
+from simple_shuffle.permutation import FeistelPermutation, derive_seed
+from simple_shuffle.player import PermutedShuffler
+
+
+FILES = ["/music/%03d.flac" % number for number in range(100)]
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 17, 1000])
+def test_permutation_is_a_bijection(size):
+    permutation = FeistelPermutation(size, 42)
+    moved = [permutation[index] for index in range(size)]
+    assert sorted(moved) == list(range(size))
+    assert [permutation.inverse(index) for index in moved] == \
+        list(range(size))
+
+
+def test_resume_from_seed_and_index():
+    played = PermutedShuffler("/music", 42, 0, FILES)
+    for _ in range(10):
+        played.next()
+    resumed = PermutedShuffler("/music", *played.state, files=FILES)
+    assert resumed.current == played.current
+    assert resumed.upcoming(20) == played.upcoming(20)
+    assert PermutedShuffler("/music", 43, 10, FILES).upcoming(20) != \
+        played.upcoming(20)
+
+
+def test_plays_every_file_once():
+    shuffler = PermutedShuffler("/music", 7, 0, FILES)
+    assert sorted(shuffler.next() for _ in FILES) == FILES
+    with pytest.raises(StopIteration):
+        shuffler.next()
+
+
+def test_current_wraps_before_first_next():
+    shuffler = PermutedShuffler("/music", 7, 0, FILES)
+    assert shuffler.current == shuffler.at(len(FILES) - 1)
+
+
+def test_empty_library():
+    shuffler = PermutedShuffler("/music", 7, 0, [])
+    assert shuffler.future is None
+    with pytest.raises(IndexError):
+        shuffler.current
+
+
+def test_derived_seeds():
+    assert derive_seed(42, "kitchen") == derive_seed(42, "kitchen")
+    assert derive_seed(42, "kitchen") != derive_seed(42, "den")
+    assert derive_seed(42, "kitchen") != derive_seed(43, "kitchen")
@@ -0,0 +1,162 @@
+"""Tests for building a Player on a real folder of files."""
+from os.path import basename, join
+from time import sleep
+import pytest
+from conftest import TRACKS
+from simple_shuffle.audio import NullBackend, PlaybackError, get_backend
+from simple_shuffle.config import Config
+from simple_shuffle.permutation import derive_seed
+from simple_shuffle.player import Library, Player, scan
+
+
+class WavOnlyBackend(NullBackend):
+    """A NullBackend which can only play WAVs, and lists what it loads."""
+    def __init__(self):
+        super().__init__()
+        self.loads = []
+
+    def load(self, source, namehint=''):
+        name = source if isinstance(source, str) else "memory." + namehint
+        self.loads.append(basename(name))
+        if not name.endswith(".wav"):
+            raise PlaybackError("Can't play %s" % name)
+        super().load(source, namehint)
+
+
+def test_scan_drops_duplicates(music):
+    files = scan(music)
+    assert len(files) == TRACKS
+    assert len({basename(filepath) for filepath in files}) == TRACKS
+
+
+def test_player_plays_a_folder(music):
+    player = Player(music)
+    try:
+        assert len(player.library.files) == TRACKS
+        assert not player.paused
+        first = player.current_file.filepath
+        player.skip()
+        player.begin_playback()
+        assert player.current_file.filepath != first
+        assert player.song_info_short == \
+            basename(player.current_file.filepath)[:-len(".wav")]
+        player.pause_unpause()
+        assert player.paused
+    finally:
+        player.audio.stop()
+
+
+def test_quiet_tracks_are_turned_up(music, monkeypatch):
+    from simple_shuffle import loudness
+    monkeypatch.setattr(Config, "normalize_loudness", True)
+    player = Player(music, False)
+    try:
+        filepath = player.current_file.filepath
+        player.library.cache.put(
+            loudness.KIND, filepath, Config.loudness_target - 6
+        )
+        player.begin_playback()
+        assert player.gain > 1.0
+        assert player.audio.mixer.music.get_volume() == pytest.approx(
+            player.gain / player.headroom, abs=0.01
+        )
+    finally:
+        player.audio.stop()
+
+
+def test_unmeasured_tracks_are_not_turned_down(music, monkeypatch):
+    monkeypatch.setattr(Config, "normalize_loudness", True)
+    player = Player(music, False, audio=NullBackend())
+    player.begin_playback()
+    assert player.headroom > 1.0
+    assert player.audio.volume == 1.0
+
+
+def test_skips_are_coalesced(music, monkeypatch):
+    player = Player(music, False)
+    loads = []
+    monkeypatch.setattr(
+        player, "begin_playback",
+        lambda skipped=False: loads.append(player.shuffle.current)
+    )
+    player.skip()
+    player.schedule_playback()
+    assert len(loads) == 1
+    sleep(Config.skip_debounce * 2)
+    assert len(loads) == 1
+    for _ in range(4):
+        player.skip()
+        player.schedule_playback()
+    assert len(loads) == 2
+    sleep(Config.skip_debounce * 2)
+    assert loads[-1] == player.shuffle.current
+    assert len(loads) == 3
+
+
+def test_library_is_scanned_once(music):
+    library = Library(music)
+    assert len(library.files) == TRACKS
+    assert Player(music, False, library).library is library
+
+
+def test_zones_play_at_the_same_time(music, monkeypatch):
+    monkeypatch.setattr(Config, "shuffle_mode", "permutation")
+    library = Library(music)
+    living_room = Player(music, True, library, get_backend(), 42)
+    kitchen = Player(
+        music, False, library, get_backend(separate=True),
+        derive_seed(42, "kitchen")
+    )
+    try:
+        kitchen.pause_unpause()
+        assert not living_room.paused and not kitchen.paused
+        assert living_room.owns_audio and kitchen.owns_audio
+        assert living_room.shuffle.upcoming(TRACKS) != \
+            kitchen.shuffle.upcoming(TRACKS)
+        kitchen.volume_down()
+        assert kitchen.audio.position >= 0
+    finally:
+        living_room.audio.stop()
+        kitchen.audio.quit()
+
+
+def write_cover(music: str) -> str:
+    """Put some cover art, which can't be played, in the first album."""
+    cover = join(music, "album0", "cover.jpg")
+    with open(cover, "wb") as file:
+        file.write(b"\xff\xd8\xff\xe0" + bytes(1000))
+    return cover
+
+
+def test_unplayable_files_are_passed_over(music):
+    cover = write_cover(music)
+    audio = WavOnlyBackend()
+    player = Player(music, False, audio=audio)
+    player.shuffle.enqueue(cover)
+    player.skip()
+    player.buffer.prefetch([cover])
+    for _ in range(100):
+        if cover in player.buffer:
+            break
+        sleep(0.01)
+    player.begin_playback()
+    assert len(audio.loads) == 1
+    assert audio.loads[0] == basename(player.current_file.filepath)
+    assert audio.position == 0
+
+
+def test_a_play_is_recorded_once(music, monkeypatch, tmp_path_factory):
+    monkeypatch.setattr(Config, "prefetch_budget", 0)
+    monkeypatch.setattr(Config, "history_file", str(
+        tmp_path_factory.mktemp("history") / "history.sqlite"
+    ))
+    cover = write_cover(music)
+    player = Player(music, False, audio=WavOnlyBackend())
+    player.shuffle.enqueue(cover)
+    player.skip()
+    player.begin_playback()
+    player.history.flush()
+    assert [(filepath, event) for _, filepath, event in
+            player.history.recent(10)] == \
+        [(player.current_file.filepath, "played")]
+    player.history.close()
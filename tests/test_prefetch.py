@@ -0,0 +1,44 @@
+"""Tests for reading upcoming tracks into memory."""
+from os.path import join
+from threading import Event
+from conftest import write_wav
+from simple_shuffle.prefetch import TrackBuffer
+
+
+def finish(buffer: TrackBuffer):
+    """Wait for the buffer's worker to get through what it was given."""
+    buffer.pool.submit(lambda: None).result()
+
+
+def test_only_skips_are_counted(tmp_path):
+    first, second = str(tmp_path / "first.wav"), str(tmp_path / "second.wav")
+    write_wav(first, 220)
+    write_wav(second, 440)
+    buffer = TrackBuffer(1024 * 1024)
+    buffer.prefetch([first, second])
+    finish(buffer)
+    assert buffer.take(first, skipped=True).sample_rate == 22050
+    assert buffer.take(first, skipped=True) is None
+    assert buffer.take(second) is not None
+    stats = buffer.stats
+    assert (stats["hits"], stats["misses"], stats["late"]) == (1, 1, 0)
+    assert stats["hit_rate"] == 0.5
+    assert stats["bytes_used"] == 0
+    buffer.close()
+
+
+def test_tracks_played_while_being_read_are_not_kept(tmp_path):
+    filepath = join(str(tmp_path), "track.wav")
+    write_wav(filepath, 220)
+    buffer = TrackBuffer(1024 * 1024)
+    reading = Event()
+    buffer.pool.submit(reading.wait)
+    buffer.prefetch([filepath])
+    assert buffer.take(filepath, skipped=True) is None
+    reading.set()
+    finish(buffer)
+    assert filepath not in buffer
+    stats = buffer.stats
+    assert (stats["hits"], stats["misses"], stats["late"]) == (0, 0, 1)
+    assert stats["bytes_used"] == 0
+    buffer.close()
@@ -0,0 +1,64 @@
+"""Tests for reading sample rates from synthetic stream headers."""
+from io import BytesIO
+from struct import pack
+import pytest
+from simple_shuffle.probe import read_sample_rate
+
+
+def flac(rate: int) -> bytes:
+    # The last metadata block, STREAMINFO, is 34 bytes long.
+    streaminfo = pack('>HH', 4096, 4096) + bytes(6)\
+        + (rate << 44 | 1 << 41 | 15 << 36).to_bytes(8, 'big') + bytes(16)
+    return b'fLaC' + b'\x80' + len(streaminfo).to_bytes(3, 'big') + streaminfo
+
+
+def ogg(packet: bytes) -> bytes:
+    return b'OggS' + bytes([0, 2]) + bytes(8) + pack('<III', 1, 0, 0)\
+        + bytes([1, len(packet)]) + packet
+
+
+def vorbis(rate: int) -> bytes:
+    return ogg(b'\x01vorbis' + pack('<IBIiii', 0, 2, rate, 0, 0, 0) + b'\xb8')
+
+
+def opus(rate: int) -> bytes:
+    return ogg(b'OpusHead' + pack('<BBHIhB', 1, 2, 312, rate, 0, 0))
+
+
+def wav(rate: int) -> bytes:
+    # An odd-sized chunk, padded to an even length, before the fmt chunk.
+    info = b'LIST' + pack('<I', 5) + b'INFO!' + b'\x00'
+    fmt = b'fmt ' + pack('<IHHIIHH', 16, 1, 2, rate, rate * 4, 4, 16)
+    data = b'data' + pack('<I', 4) + bytes(4)
+    body = b'WAVE' + info + fmt + data
+    return b'RIFF' + pack('<I', len(body)) + body
+
+
+def id3v2(size: int) -> bytes:
+    syncsafe = bytes((size >> shift) & 0x7f for shift in (21, 14, 7, 0))
+    return b'ID3' + bytes([4, 0, 0]) + syncsafe + bytes(size)
+
+
+MP3_FRAME = b'\xff\xfb\x94\x64'  # MPEG 1 layer III, 128kbps, 48kHz
+
+
+@pytest.mark.parametrize("header, rate", [
+    (flac(96000), 96000),
+    (vorbis(44100), 44100),
+    (opus(44100), 48000),
+    (wav(22050), 22050),
+    (MP3_FRAME + bytes(400), 48000),
+    (id3v2(300) + MP3_FRAME + bytes(400), 48000),
+])
+def test_sample_rate_from_header(header, rate):
+    assert read_sample_rate(BytesIO(header)) == rate
+
+
+@pytest.mark.parametrize("header", [
+    b'\x89PNG\r\n\x1a\n' + bytes(20) + MP3_FRAME + bytes(100),
+    b'\xff\xd8\xff\xe0' + bytes(20) + MP3_FRAME + bytes(100),
+    b'\x00\x00\x00\x20ftypM4A ' + bytes(20) + MP3_FRAME,
+    id3v2(10) + b'junk' + MP3_FRAME,
+])
+def test_frames_after_the_start_are_ignored(header):
+    assert read_sample_rate(BytesIO(header)) is None
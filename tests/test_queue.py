@@ -0,0 +1,38 @@
+"""Tests for the play-next queue in front of the shuffle order."""
+from simple_shuffle.player import PermutedShuffler, PlayQueue
+
+
+FILES = ["/music/%02d.flac" % number for number in range(10)]
+
+
+def test_queued_files_play_first():
+    queue = PlayQueue(PermutedShuffler("/music", 42, 0, FILES))
+    shuffled = queue.upcoming(3)
+    queue.enqueue(FILES[0])
+    queue.enqueue(FILES[1], 0)
+    assert queue.future == FILES[1]
+    assert queue.upcoming(3) == [FILES[1], FILES[0], shuffled[0]]
+    assert [queue.next() for _ in range(3)] == \
+        [FILES[1], FILES[0], shuffled[0]]
+
+
+def test_queue_leaves_the_shuffle_order_alone():
+    queue = PlayQueue(PermutedShuffler("/music", 42, 0, FILES))
+    playing = queue.next()
+    queue.enqueue(FILES[5])
+    assert queue.next() == FILES[5]
+    assert queue.state == (42, 1)
+    # Going back from a queued file returns to the shuffled one before it.
+    assert queue.previous() == playing
+    assert queue.current == playing
+
+
+def test_remove_move_and_clear():
+    queue = PlayQueue(PermutedShuffler("/music", 42, 0, FILES))
+    for filepath in FILES[:4]:
+        queue.enqueue(filepath)
+    queue.move(0, 3)
+    assert list(queue.queued) == [FILES[1], FILES[2], FILES[3], FILES[0]]
+    assert queue.remove(1) == FILES[2]
+    queue.clear()
+    assert list(queue.queued) == []
@@ -0,0 +1,30 @@
+"""Tests for warming the page cache with upcoming files."""
+from simple_shuffle.readahead import ReadAhead
+
+
+def finish(readahead: ReadAhead):
+    """Wait for the ReadAhead's worker to get through what it was given."""
+    readahead.pool.submit(lambda: None).result()
+
+
+def test_windows_share_the_budget(tmp_path):
+    files = []
+    for name in "abcdef":
+        (tmp_path / name).write_bytes(bytes(1000))
+        files.append(str(tmp_path / name))
+    a, b, c, d, e, f = files
+    readahead = ReadAhead(3500)
+    readahead.advise([a, b], 1)
+    finish(readahead)
+    assert readahead.advised == {a: 1000, b: 1000}
+    # Another player's window doesn't push out the first one's.
+    readahead.advise([c, d], 2)
+    finish(readahead)
+    assert readahead.advised == {a: 1000, b: 1000, c: 1000, d: 500}
+    # Files which have left their window make room for the new ones, and
+    # the fronts of the windows come first.
+    readahead.advise([e, f], 1)
+    finish(readahead)
+    assert readahead.advised == {e: 1000, c: 1000, f: 1000, d: 500}
+    assert readahead.stats["bytes"] == 3500
+    readahead.close()
@@ -0,0 +1,35 @@
+"""Tests for the tag index."""
+import pytest
+from simple_shuffle.cache import FileCache
+from simple_shuffle.player import scan
+from simple_shuffle import search
+from simple_shuffle.search import TagIndex
+
+
+def test_search_by_filename_prefix(music):
+    cache = FileCache(":memory:")
+    index = TagIndex(scan(music, cache), cache)
+    with pytest.raises(LookupError):
+        index.search("track")
+    index.build()
+    assert [result.text for result in index.search("track3")] == ["track3"]
+    assert len(index.search("track", limit=2)) == 2
+    # Tags read the first time come from the cache the second.
+    assert len(cache.get_many("tags", index.files)) == len(index.files)
+
+
+def test_search_every_word_across_shards(tmp_path, monkeypatch):
+    monkeypatch.setattr(search, "SHARD_SIZE", 2)
+    files = []
+    for name in ("red fish", "blue fish", "red car", "one red fish",
+                 "fishing boat", "redder fish"):
+        (tmp_path / (name + ".mp3")).write_bytes(b"")
+        files.append(str(tmp_path / (name + ".mp3")))
+    index = TagIndex(files)
+    index.build()
+    assert len(index.shards) == 3
+    assert [result.text for result in index.search("Fish RED")] == \
+        ["red fish", "one red fish", "redder fish"]
+    assert [result.text for result in index.search("fi re", limit=2)] == \
+        ["red fish", "one red fish"]
+    assert index.search("red fish boat") == []
@@ -0,0 +1,167 @@
+"""Drive the server's API end to end, on a simulated audio backend.
+
+Every zone plays through a NullBackend on the same SimulatedClock, so
+positions only change when the test moves the clock.
+"""
+import os
+from json import loads
+from time import sleep
+from urllib.parse import quote
+import pytest
+from simple_shuffle.audio import NullBackend, SimulatedClock
+from simple_shuffle.config import Config
+from simple_shuffle.search import TagIndex
+
+# The server starts loading simple_shuffle_folder as soon as it's imported;
+# give it one which fails quickly, as each test loads its own.
+os.environ["simple_shuffle_folder"] = os.path.join(
+    os.path.dirname(os.environ["simple_shuffle_cache"]), "not a folder"
+)
+from simple_shuffle import server  # noqa: E402
+
+TRACK_SECONDS = 180.0
+
+
+@pytest.fixture
+def clock(music, monkeypatch, tmp_path_factory) -> SimulatedClock:
+    clock = SimulatedClock()
+    monkeypatch.setattr(Config, "history_file", str(
+        tmp_path_factory.mktemp("history") / "history.sqlite"
+    ))
+    monkeypatch.setattr(
+        server, "get_backend", lambda **options: NullBackend(
+            clock, load_time=0.05, duration=lambda source: TRACK_SECONDS
+        )
+    )
+    monkeypatch.setattr(Config, "skip_debounce", 0)
+    monkeypatch.setattr(Config, "zones", ["kitchen"])
+    server.loaded.wait()
+    server.zones.clear()
+    server.frozen.clear()
+    server.load_error = None
+    server.load(music)
+    assert server.load_error is None
+    return clock
+
+
+@pytest.fixture
+def api(clock):
+    client = server.app.test_client()
+
+    def get(endpoint: str) -> str:
+        response = client.get(endpoint)
+        assert response.status_code in (200, 204), response.data
+        return response.get_data(as_text=True)
+    return get
+
+
+def test_playback_follows_the_clock(clock, api):
+    assert api("/ready") == "ready"
+    assert api("/current_position") == "0"
+    clock.advance(10)
+    assert api("/current_position") == "10000"
+    api("/pause_unpause")
+    clock.advance(10)
+    assert api("/current_position") == "10000"
+    api("/pause_unpause")
+    clock.advance(TRACK_SECONDS)
+    assert api("/current_position") == "-1"
+
+
+def test_skip_and_previous(clock, api):
+    first = api("/current_file")
+    clock.advance(30)
+    api("/skip")
+    second = api("/current_file")
+    assert second != first
+    # Loading took the backend's load_time on the simulated clock.
+    assert clock() == pytest.approx(30.1)
+    assert api("/current_position") == "0"
+    clock.advance(3)
+    # Within the first five seconds, previous restarts the track...
+    api("/previous")
+    assert api("/current_file") == second
+    assert api("/current_position") == "0"
+    # ...and otherwise goes back to the one before.
+    clock.advance(10)
+    api("/previous")
+    assert api("/current_file") == first
+
+
+def test_volume(clock, api):
+    backend = server.player.audio
+    api("/volume_down")
+    api("/volume_down")
+    assert float(api("/current_volume")) == pytest.approx(0.9)
+    assert backend.volume == pytest.approx(
+        0.9 * server.player.gain / server.player.headroom
+    )
+    for _ in range(5):
+        api("/volume_up")
+    assert float(api("/current_volume")) == 1.0
+
+
+def test_zones_are_independent(clock, api):
+    kitchen = server.zones["kitchen"]
+    assert kitchen.paused
+    api("/zones/kitchen/pause_unpause")
+    assert not kitchen.paused and not server.player.paused
+    default_file = api("/current_file")
+    api("/zones/kitchen/skip")
+    assert api("/current_file") == default_file
+    api("/zones/kitchen/volume_down")
+    assert float(api("/current_volume")) == 1.0
+
+
+def test_only_heard_tracks_are_skipped(clock, api, monkeypatch):
+    monkeypatch.setattr(Config, "skip_debounce", 0.05)
+    heard = api("/current_file")
+    for _ in range(4):
+        api("/skip")
+    sleep(Config.skip_debounce * 4)
+    last = api("/current_file")
+    # A track which has ended isn't skipped, either.
+    clock.advance(TRACK_SECONDS)
+    api("/skip")
+    server.library.history.flush()
+    skipped = {
+        event["file"] for event in loads(api("/stats?recent=100"))
+        if event["event"] == "skipped"
+    }
+    assert {stats["file"] for stats in loads(api("/stats?by=skips&top=100"))
+            if stats["skips"]} == skipped
+    assert heard in skipped and last not in skipped
+    for track in skipped:
+        assert loads(api("/stats?file=%s" % track))["plays"] == 1
+
+
+def test_stats_rejects_bad_counts(clock):
+    client = server.app.test_client()
+    for query in ("top=0", "recent=-1", "top=x", "by=volume"):
+        assert client.get("/stats?" + query).status_code == 400
+
+
+def test_queue(clock, api, monkeypatch):
+    # Queueing doesn't wait for the search index to be built.
+    monkeypatch.setattr(server, "index", TagIndex([]))
+    first, second, third = sorted(server.library.files)[:3]
+    api("/queue/add?file=" + quote(first))
+    api("/queue/add?file=" + quote(second))
+    api("/play_next?file=" + quote(third))
+    assert loads(api("/queue")) == [third, first, second]
+    api("/queue/move?from=0&to=2")
+    assert api("/queue/remove?position=1") == second
+    assert loads(api("/queue")) == [first, third]
+    assert loads(api("/zones/kitchen/queue")) == []
+    api("/skip")
+    assert api("/current_file") == first
+    api("/queue/clear")
+    assert loads(api("/queue")) == []
+    client = server.app.test_client()
+    for query, status in (
+        ("add?file=" + quote(server.library.folder), 404),
+        ("add?file=%s&position=x" % quote(first), 400),
+        ("remove?position=5", 404),
+        ("move?from=0", 400),
+    ):
+        assert client.get("/queue/" + query).status_code == status